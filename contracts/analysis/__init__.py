@@ -1,6 +1,11 @@
-from main.analysis import Analysis, AnalysisManager
+from main.analysis import Analysis, AnalysisManager, Payload, \
+    get_default_store
 
 from contracts.analysis.analysis import *
+from contracts.analysis.histogram import contracts_price_histogram, \
+    entities_values_histogram
+from contracts.analysis.inequality import contracted_lorenz_curve
+from contracts.analysis.ranking import municipalities_ranking
 
 
 _allAnalysis = [
@@ -9,18 +14,51 @@ _allAnalysis = [
     Analysis('excluding_municipalities_contracts_time_series',
              exclude_municipalities_contracts_time_series),
     Analysis('municipalities_procedure_types_time_series',
-             municipalities_procedure_types_time_series),
-    Analysis('procedure_type_time_series', procedure_type_time_series),
+             municipalities_procedure_types_time_series, version=2),
+    Analysis('procedure_type_time_series', procedure_type_time_series,
+             version=2),
     Analysis('contracts_time_series', contracts_price_time_series),
     Analysis('contracts_statistics', contracts_statistics),
     Analysis('contracts_price_distribution', contracts_price_histogram),
     Analysis('ministries_contracts_time_series', ministries_contracts_time_series),
     Analysis('entities_values_distribution', entities_values_histogram),
-    Analysis('contracted_lorenz_curve', contracted_lorenz_curve),
-    Analysis('municipalities_ranking', municipalities_ranking),
+    Analysis('contracted_lorenz_curve', contracted_lorenz_curve, version=2),
+    Analysis('municipalities_ranking', municipalities_ranking, version=2),
+]
+
+# payloads of the data endpoints, rendered by `contracts.views_data`.
+_allPayloads = [
+    Payload('contracts-price-histogram-json',
+            'contracts.views_data.contracts_price_histogram_json'),
+    Payload('procedure-types-time-series-json',
+            'contracts.views_data.procedure_types_time_series_json',
+            'procedure_type_time_series'),
+    Payload('contracts-time-series-json',
+            'contracts.views_data.contracts_time_series_json',
+            'contracts_time_series'),
+    Payload('excluding-municipalities-contracts-time-series-json',
+            'contracts.views_data.contracts_time_series_json',
+            'excluding_municipalities_contracts_time_series'),
+    Payload('municipalities-contracts-time-series-json',
+            'contracts.views_data.contracts_time_series_json',
+            'municipalities_contracts_time_series'),
+    Payload('municipalities-procedure-types-time-series-json',
+            'contracts.views_data.procedure_types_time_series_json',
+            'municipalities_procedure_types_time_series'),
+    Payload('ministries-contracts-time-series-json',
+            'contracts.views_data.contracts_time_series_json',
+            'ministries_contracts_time_series'),
+    Payload('entities-values-histogram-json',
+            'contracts.views_data.entities_values_histogram_json'),
+    Payload('contracted-lorenz-curve-json',
+            'contracts.views_data.contracted_lorenz_curve'),
+    Payload('municipalities-ranking-json',
+            'contracts.views_data.municipalities_ranking'),
 ]
 
 
-analysis_manager = AnalysisManager()
+analysis_manager = AnalysisManager(get_default_store())
 for x in _allAnalysis:
     analysis_manager.register(x)
+for x in _allPayloads:
+    analysis_manager.register_payload(x)
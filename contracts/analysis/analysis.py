@@ -1,13 +1,12 @@
-from collections import defaultdict
-
 from datetime import date
 import datetime
 import calendar
 
-from django.db.models import Sum, Count, F
+from django.db.models import Sum, Count
 from django.db import connection
 
 from contracts import models
+from contracts.analysis.pivot import pivot, to_series
 
 
 def add_months(sourcedate, months):
@@ -18,108 +17,6 @@ def add_months(sourcedate, months):
     return datetime.date(year, month, day)
 
 
-def contracts_price_histogram():
-    """
-    Since the distribution is broad, we use logarithmic bins.
-
-    For each bin, we filter contracts within these values.
-    40 was arbitrarily chosen, but includes all prices.
-    """
-    cases = 'CASE'
-    for x in range(1, 41):
-        cases += ' WHEN (%d < contracts_contract.price/100 AND ' \
-                 'contracts_contract.price/100 < %d) THEN %d\n' % (2**x, 2*2**x,
-                                                                   2**x)
-    cases += ' END'
-
-    query = """
-        SELECT %s AS hist, COUNT(*)
-        FROM contracts_contract
-        WHERE contracts_contract.price > 500
-        GROUP BY hist
-        HAVING COUNT(*) > 5
-        ORDER BY hist ASC
-    """ % cases
-
-    cursor = connection.cursor()
-    cursor.execute(query)
-
-    data = []
-    for row in cursor.fetchall():
-        value, count = row
-        if value is not None:
-            data.append({'min_value': value, 'max_value': value*2, 'count': count})
-    return data
-
-
-def entities_values_histogram():
-    """
-    Returns a list of tuples (value, count_earnings, count_expenses)
-    where `value` is 2^i and count_* is the number of entities with
-    earnings/expenses in range [2^i, 2^(i+1)].
-    We use logarithmic bins because the distribution is broad.
-    """
-    def _entities_histogram():
-        cases_earned = 'CASE'
-        for x in range(1, 43):
-            cases_earned += ' WHEN (' \
-                '%d < contracts_entitydata.total_earned/100 AND ' \
-                'contracts_entitydata.total_earned/100 < %d) THEN %d\n' % \
-                            (2**x, 2*2**x, 2**x)
-        cases_earned += 'ELSE 0 END'
-
-        cases_expended = 'CASE'
-        for x in range(1, 41):
-            cases_expended += ' WHEN (' \
-                '%d < contracts_entitydata.total_expended/100 AND ' \
-                'contracts_entitydata.total_expended/100 < %d) THEN %d\n' % \
-                              (2**x, 2*2**x, 2**x)
-        cases_expended += 'ELSE 0 END'
-
-        query = """
-        SELECT (%s, %s) as hist, COUNT(*)
-        FROM contracts_entity
-        INNER JOIN contracts_entitydata ON (contracts_entity.id =
-        contracts_entitydata.entity_id)
-        WHERE contracts_entitydata.total_earned > 100
-        GROUP BY hist
-        """ % (cases_earned, cases_expended)
-
-        cursor = connection.cursor()
-        cursor.execute(query)
-
-        data = []
-        for row in cursor.fetchall():
-            value, count = row
-            value = value[1:-1].split(',')
-            value = [int(value[0]), int(value[1])]
-            data.append([value, count])
-        return data
-
-    data = _entities_histogram()
-    result_earnings = defaultdict(int)
-    result_expenses = defaultdict(int)
-    for x in data:
-        values, count = x
-        result_earnings[values[0]] += count
-        result_expenses[values[1]] += count
-
-    result = [[], []]
-    for x in sorted(set(result_earnings.keys()) | set(result_expenses.keys())):
-        if x == 0:
-            continue
-        result[0].append(
-            {'min_value': int(x + 0.5),
-             'max_value': int(2*x + 0.5),
-             'value': result_earnings[x]})
-        result[1].append(
-            {'min_value': int(x + 0.5),
-             'max_value': int(2*x + 0.5),
-             'value': result_expenses[x]})
-
-    return result
-
-
 def contracts_statistics():
     contracts = models.Contract.objects.all()
 
@@ -139,81 +36,6 @@ def contracts_statistics():
             'month_count': month_price['count']}
 
 
-def municipalities_ranking():
-    """
-    Computes multiple time-series of annotations of all municipalities:
-    - number of contracts
-    - price of contracts
-    - Mean delta time
-    - Mean category depth
-    - Mean number of contracts with wrong/invalid descriptions
-
-    Returns a dictionary entity_id -> time series
-    """
-    from pt_regions import municipalities
-
-    NIF_TO_NAME = {}
-    for m in municipalities():
-        NIF_TO_NAME[str(m['NIF'])] = m['name']
-
-    query = '''
-SELECT contracts_entity.base_id, contracts_entity.nif,
-  EXTRACT(YEAR FROM contracts_contract.signing_date)                   AS s_year,
-
-  COUNT(contracts_contract.id),
-  SUM(contracts_contract.price)                                        AS value,
-  AVG(ABS(contracts_contract.added_date -
-      contracts_contract.signing_date))                                AS avg_deltat,
-  AVG(COALESCE(contracts_category.depth,
-               0))                                                     AS avg_depth,
-  AVG(CASE WHEN
-    contracts_contract.description = contracts_contract.contract_description OR
-    contracts_contract.description IS NULL OR
-    contracts_contract.contract_description IS NULL
-    THEN 0
-      ELSE 1 END)                                                      AS count_empty_text
-FROM contracts_contract
-  INNER JOIN contracts_contract_contractors
-    ON (contracts_contract.id = contracts_contract_contractors.contract_id)
-  LEFT OUTER JOIN contracts_category
-    ON (contracts_contract.category_id = contracts_category.id)
-  INNER JOIN contracts_entity
-    ON (contracts_contract_contractors.entity_id = contracts_entity.id)
-WHERE EXTRACT(YEAR FROM contracts_contract.signing_date) > 2009 AND
-      contracts_entity.nif IN (%s)
-GROUP BY contracts_entity.base_id, contracts_entity.nif, s_year
-HAVING COUNT(contracts_contract.id) > 0
-ORDER BY contracts_entity.base_id, s_year
-    ''' % ','.join(list(map(lambda x: "'%s'" % x, NIF_TO_NAME.keys())))
-
-    def raw_to_python(cursor):
-        data = {}
-        for row in cursor.fetchall():
-            base_id, nif, year, count, value, \
-                avg_deltat, avg_specificity, avg_good_text = row
-
-            if base_id not in data:
-                data[base_id] = []
-
-            entry = {
-                'name': NIF_TO_NAME[nif],
-                'date': datetime.date(int(year), 1, 1),
-                'count': int(count),
-                'value': float(value)/100,
-                'avg_deltat': float(avg_deltat),
-                'avg_specificity': float(avg_specificity),
-                'avg_good_text': float(avg_good_text)
-            }
-            data[base_id].append(entry)
-
-        return data
-
-    cursor = connection.cursor()
-    cursor.execute(query)
-
-    return raw_to_python(cursor)
-
-
 def _contracts_time_series_to_python(cursor):
     data = []
     for row in cursor.fetchall():
@@ -232,6 +54,12 @@ def _contracts_time_series_to_python(cursor):
 
 
 def _entities_contracts_time_series(conditional_statement):
+    """
+    Returns the time-series of contracts of the entities that satisfy
+    `conditional_statement`. A contract is counted once, even if more than
+    one of its contractors satisfies it, so the rollup (one row per
+    contractor) is not used.
+    """
     distinct_query = \
         '''
 SELECT DISTINCT contracts_contract.id AS id,
@@ -243,12 +71,11 @@ FROM contracts_contract
         ON ( contracts_contract.id = contracts_contract_contractors.contract_id )
     INNER JOIN contracts_entity
         ON ( contracts_contract_contractors.entity_id = contracts_entity.id )
-WHERE %s
+WHERE contracts_contract.signing_date >= '2010-01-01' AND %s
         ''' % conditional_statement
 
     query = '''SELECT contracts.s_year, contracts.s_month, COUNT(contracts.id), SUM(contracts.price)
                FROM (%s) AS contracts
-               WHERE contracts.s_year > 2009
                GROUP BY contracts.s_year, contracts.s_month
                ORDER BY contracts.s_year, contracts.s_month
             ''' % distinct_query
@@ -277,14 +104,15 @@ def exclude_municipalities_contracts_time_series():
 
 def contracts_price_time_series():
 
-    query = '''SELECT EXTRACT(YEAR FROM contracts_contract.signing_date) AS s_year,
-       EXTRACT(MONTH FROM contracts_contract.signing_date) AS s_month,
-       COUNT(contracts_contract.id),
-       SUM(contracts_contract.price)
-       FROM contracts_contract
-       WHERE EXTRACT(YEAR FROM contracts_contract.signing_date) > 2009
-       GROUP BY s_year, s_month
-       ORDER BY s_year, s_month
+    query = '''SELECT contracts_contractsrollup.year,
+       contracts_contractsrollup.month,
+       SUM(contracts_contractsrollup.count),
+       SUM(contracts_contractsrollup.price)
+       FROM contracts_contractsrollup
+       WHERE contracts_contractsrollup.entity_id IS NULL AND
+             contracts_contractsrollup.year > 2009
+       GROUP BY contracts_contractsrollup.year, contracts_contractsrollup.month
+       ORDER BY contracts_contractsrollup.year, contracts_contractsrollup.month
     '''
 
     cursor = connection.cursor()
@@ -299,25 +127,28 @@ def ministries_contracts_time_series():
 
 
 def _procedure_types_time_series_to_python(cursor):
-        data = []
-        for row in cursor.fetchall():
-            procedure_name, year, month, count, value = row
-
-            min_date = datetime.date(int(year), int(month), 1)
-            max_date = add_months(min_date, 1)
-
-            entry = {'procedure': procedure_name,
-                     'from': min_date,
-                     'to': max_date,
+    """
+    Returns a series per procedure type with the value and count of contracts
+    of every month, zero on months without contracts.
+    """
+    rows = []
+    for procedure_name, year, month, count, value in cursor.fetchall():
+        rows.append({'procedure': procedure_name,
+                     'month': '%04d-%02d' % (year, month),
                      'count': int(count),
-                     'value': int(value/100)}
+                     'value': int(value/100)})
 
-            data.append(entry)
-        return data
+    grid = pivot(rows, ('procedure', 'month'), ('value', 'count'))
+    return to_series(grid, 'month', ('value', 'count'))
 
 
 def _entities_procedure_types_time_series(conditional_statement):
-
+    """
+    Returns the time-series by procedure type of contracts of the entities
+    that satisfy `conditional_statement`. A contract is counted once, even if
+    more than one of its contractors satisfies it, so the rollup (one row per
+    contractor) is not used.
+    """
     distinct_query = '''
 SELECT DISTINCT contracts_contract.id AS id,
                 contracts_contract.procedure_type_id AS procedure_type,
@@ -329,7 +160,7 @@ FROM contracts_contract
     ON ( contracts_contract.id = contracts_contract_contractors.contract_id )
   INNER JOIN contracts_entity
     ON ( contracts_contract_contractors.entity_id = contracts_entity.id )
-WHERE %s
+WHERE contracts_contract.signing_date >= '2010-01-01' AND %s
 ''' % conditional_statement
 
     query = '''
@@ -341,7 +172,6 @@ SELECT contracts_proceduretype.name,
 FROM (%s) AS contracts
   INNER JOIN contracts_proceduretype
     ON ( contracts.procedure_type = contracts_proceduretype.id )
-WHERE contracts.s_year > 2009
 GROUP BY contracts_proceduretype.name, contracts.s_year, contracts.s_month
 ORDER BY contracts_proceduretype.name, contracts.s_year, contracts.s_month
             ''' % distinct_query
@@ -364,16 +194,19 @@ def procedure_type_time_series():
 
     query = '''
 SELECT contracts_proceduretype.name,
-       EXTRACT(YEAR FROM contracts_contract.signing_date) AS s_year,
-       EXTRACT(MONTH FROM contracts_contract.signing_date) AS s_month,
-       COUNT(contracts_contract.id),
-       SUM(contracts_contract.price)
-FROM contracts_contract
+       contracts_contractsrollup.year,
+       contracts_contractsrollup.month,
+       SUM(contracts_contractsrollup.count),
+       SUM(contracts_contractsrollup.price)
+FROM contracts_contractsrollup
   INNER JOIN contracts_proceduretype
-    ON ( contracts_contract.procedure_type_id = contracts_proceduretype.id )
-WHERE EXTRACT(YEAR FROM contracts_contract.signing_date) > 2009
-GROUP BY contracts_proceduretype.name, s_year, s_month
-ORDER BY contracts_proceduretype.name, s_year, s_month
+    ON ( contracts_contractsrollup.procedure_type_id = contracts_proceduretype.id )
+WHERE contracts_contractsrollup.entity_id IS NULL AND
+      contracts_contractsrollup.year > 2009
+GROUP BY contracts_proceduretype.name, contracts_contractsrollup.year,
+         contracts_contractsrollup.month
+ORDER BY contracts_proceduretype.name, contracts_contractsrollup.year,
+         contracts_contractsrollup.month
     '''
 
     cursor = connection.cursor()
@@ -382,36 +215,3 @@ ORDER BY contracts_proceduretype.name, s_year, s_month
     return _procedure_types_time_series_to_python(cursor)
 
 
-def contracted_lorenz_curve():
-
-    # all entities with earnings above 1 euro, sorted by earnings.
-    entities = models.Entity.objects\
-        .filter(data__total_earned__gt=F('data__total_expended'))\
-        .order_by('data__total_earned')
-
-    entities = entities.select_related('data')  # a Django-related optimization
-
-    # compute total earnings and total number of entities
-    total_earned = entities.aggregate(total=Sum('data__total_earned'))['total']
-    total_count = entities.count()
-
-    # number of points in the curve. Too much degrades user performance.
-    number_of_points = min(500, total_count)
-
-    # compute and annotate the relative cumulative (entity.cumulative) and
-    # relative rank (entity.rank)
-    data = []
-    cumulative = 0
-    integral = 0
-    for rank, entity in enumerate(entities):
-        cumulative += entity.data.total_earned/total_earned
-        entity.rank = rank/(total_count - 1)
-        entity.cumulative = cumulative
-
-        # down-sample (but always store last point)
-        if rank % (total_count//number_of_points) == 0 or rank == total_count - 1:
-            data.append(entity)
-
-        integral += entity.cumulative/total_count
-
-    return data, 1 - 2*integral  # lorenz curve, gini index
@@ -0,0 +1,90 @@
+"""
+Histograms of values of contracts and entities, computed over arrays of
+values fetched in a single query.
+"""
+from itertools import chain
+
+import numpy as np
+
+from contracts import models
+
+
+def log_edges(minimum=2, bins=40, base=2):
+    """
+    Returns the edges of `bins` logarithmic bins starting at `minimum`:
+    `[minimum, minimum*base, ..., minimum*base**bins]`.
+    """
+    return minimum*base**np.arange(bins + 1, dtype=np.int64)
+
+
+def linear_edges(minimum, maximum, bins):
+    """
+    Returns the edges of `bins` bins of equal width in `[minimum, maximum]`.
+    """
+    return np.linspace(minimum, maximum, bins + 1)
+
+
+def histogram(values, edges):
+    """
+    Returns the number of values in each bin `[edges[i], edges[i + 1])`.
+    Values outside the edges are not counted.
+    """
+    bins = np.searchsorted(edges, values, side='right') - 1
+    bins = bins[(bins >= 0) & (bins < len(edges) - 1)]
+    return np.bincount(bins, minlength=len(edges) - 1)
+
+
+def histograms(queryset, fields, edges, unit=100):
+    """
+    Returns the histograms of each field of `fields` of `queryset`, fetching
+    all fields in one query. Values are divided by `unit` (e.g. cents to
+    euros) before being binned.
+    """
+    rows = queryset.values_list(*fields).iterator()
+    values = np.fromiter(chain.from_iterable(rows), dtype=np.int64)
+    values = values.reshape(-1, len(fields)) // unit
+
+    return [histogram(values[:, i], edges) for i in range(len(fields))]
+
+
+def to_series(edges, counts, key='count', min_count=1):
+    """
+    Returns a list per series of `counts` with the bins where any series has
+    at least `min_count` values, as dictionaries with `min_value`,
+    `max_value` and the count in `key`.
+    """
+    edges = edges.tolist()
+    shown = np.nonzero(np.max(counts, axis=0) >= min_count)[0].tolist()
+
+    return [[{'min_value': edges[i], 'max_value': edges[i + 1],
+              key: int(series[i])} for i in shown]
+            for series in counts]
+
+
+def contracts_price_histogram(bins=40, **filters):
+    """
+    Returns the histogram of prices (in euros) of contracts matching
+    `filters` (e.g. `category=category` or `signing_date__year=2014`). Since
+    the distribution is broad, we use logarithmic bins; bins with 5 or less
+    contracts are omitted.
+    """
+    # `default_objects` as the order of the contracts is irrelevant here.
+    contracts = models.Contract.default_objects.filter(price__gt=500,
+                                                       **filters)
+
+    edges = log_edges(bins=bins)
+    counts = histograms(contracts, ('price',), edges)
+    return to_series(edges, counts, min_count=6)[0]
+
+
+def entities_values_histogram(bins=42, **filters):
+    """
+    Returns the histograms of earnings and of expenses (in euros) of entities
+    whose data matches `filters`, as two lists with the same bins.
+    We use logarithmic bins because the distribution is broad.
+    """
+    data = models.EntityData.objects.filter(total_earned__gt=100, **filters)
+
+    edges = log_edges(bins=bins)
+    counts = histograms(data, ('total_earned', 'total_expended'), edges)
+    return to_series(edges, counts, key='value')
@@ -0,0 +1,72 @@
+"""
+Measures of inequality (Lorenz curve and Gini index) of how much entities
+earned from contracts, computed over arrays of earnings.
+"""
+from django.db.models import F, Sum
+import numpy as np
+
+from contracts import models
+
+
+def entities_earnings(**contract_filters):
+    """
+    Returns a sorted array with how much each private entity (an entity that
+    earned more than it expended) earned.
+
+    If `contract_filters` are given (lookups of `Contract`, e.g.
+    `district=district` or `signing_date__year=2014`), only the contracts that
+    match them count to the earnings, and entities without such contracts are
+    excluded.
+    """
+    entities = models.Entity.objects\
+        .filter(data__total_earned__gt=F('data__total_expended'))
+
+    if contract_filters:
+        # filtering before annotating restricts the sum to those contracts.
+        entities = entities\
+            .filter(**dict(('contract__' + lookup, value)
+                           for lookup, value in contract_filters.items()))\
+            .annotate(earned=Sum('contract__price'))\
+            .values_list('earned', flat=True)
+    else:
+        entities = entities.values_list('data__total_earned', flat=True)
+
+    earnings = np.fromiter(entities, dtype=np.float64)
+    earnings.sort()
+    return earnings
+
+
+def lorenz_curve(earnings, number_of_points=500):
+    """
+    Returns `(rank, cumulative, gini_index)` of the sorted array `earnings`:
+    `rank` and `cumulative` are the coordinates of (at most `number_of_points`
+    plus the last) points of the Lorenz curve.
+    """
+    count = len(earnings)
+    if count == 0 or earnings[-1] <= 0:
+        return np.zeros(0), np.zeros(0), 0.
+
+    cumulative = np.cumsum(earnings)
+    cumulative /= cumulative[-1]
+    if count > 1:
+        rank = np.arange(count) / (count - 1)
+    else:
+        rank = np.zeros(1)
+
+    gini_index = 1 - 2*cumulative.mean()
+
+    step = count // min(number_of_points, count)
+    points = np.arange(0, count, step)
+    if points[-1] != count - 1:
+        points = np.append(points, count - 1)
+
+    return rank[points], cumulative[points], float(gini_index)
+
+
+def contracted_lorenz_curve(**contract_filters):
+    """
+    Returns `(rank, cumulative, gini_index)` of the earnings of private
+    entities, optionally restricted to contracts matching `contract_filters`
+    (see `entities_earnings`).
+    """
+    return lorenz_curve(entities_earnings(**contract_filters))
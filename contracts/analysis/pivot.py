@@ -0,0 +1,50 @@
+"""
+Reshapes rows of aggregated values into dense grids, one dimension per key.
+"""
+import numpy as np
+
+
+def pivot(rows, keys, values):
+    """
+    Returns a dense grid of `rows` (dictionaries) with one dimension per key
+    of `keys`: a dictionary with the sorted `labels` of each key and, for each
+    of `values`, an array with the sum of the rows in each cell (zero in cells
+    without rows).
+
+    Keys of the rows not in `keys` are summed over, so a grid with less
+    dimensions is a pivot of the same rows.
+    """
+    labels = []
+    position = []
+    for key in keys:
+        unique, inverse = np.unique([row[key] for row in rows],
+                                    return_inverse=True)
+        labels.append(unique.tolist())
+        position.append(inverse)
+    shape = tuple(len(x) for x in labels)
+
+    grid = {'labels': labels}
+    for value in values:
+        grid[value] = np.zeros(shape, dtype=np.int64)
+        np.add.at(grid[value], tuple(position),
+                  np.array([row[value] for row in rows], dtype=np.int64))
+    return grid
+
+
+def to_series(grid, label, values):
+    """
+    Returns a list with one series per label of the first dimension of the
+    2-D `grid`, as a dictionary with the `key` and its `values` (a dictionary
+    per label of the second dimension, in `label`, with each of `values`).
+    """
+    columns = dict((value, grid[value].tolist()) for value in values)
+
+    series = []
+    for i, key in enumerate(grid['labels'][0]):
+        points = []
+        for j, x in enumerate(grid['labels'][1]):
+            point = dict((value, columns[value][i][j]) for value in values)
+            point[label] = x
+            points.append(point)
+        series.append({'key': key, 'values': points})
+    return series
@@ -0,0 +1,147 @@
+"""
+Rankings of regions (municipalities, counties) by the quality of their
+contracts, computed as dense (entity x year) arrays.
+"""
+from django.db import connection
+import numpy as np
+
+
+# the quantities ranked and whether a higher value ranks first.
+METRICS = (('avg_deltat', False),
+           ('avg_good_text', True),
+           ('avg_specificity', True))
+
+
+def competition_rank(values, descending=False):
+    """
+    Returns the rank of each value of `values`, starting at 1 (the lowest
+    value or, if `descending`, the highest), where equal values share the
+    best rank (e.g. 1, 2, 2, 4). NaN values are not ranked (rank 0).
+    """
+    ranks = np.zeros(len(values), dtype=np.int64)
+    present = ~np.isnan(values)
+    values = values[present]
+    sorted_values = np.sort(values)
+
+    if descending:
+        ranks[present] = len(values) + 1 - \
+            np.searchsorted(sorted_values, values, side='right')
+    else:
+        ranks[present] = np.searchsorted(sorted_values, values) + 1
+    return ranks
+
+
+def regions_ranking(regions, first_year=2010):
+    """
+    Computes multiple time-series of annotations of the entities of
+    `regions` (a list of regions of `pt_regions`, with `NIF` and `name`):
+    - number of contracts
+    - price of contracts
+    - Mean delta time
+    - Mean category depth
+    - Mean number of contracts with wrong/invalid descriptions
+
+    Returns a dictionary with the `base_ids`, `names` and `years` and, for
+    each annotation, an array entity x year (NaN, or 0 for counts, on years
+    without contracts). The rank of each entity in each year is in
+    `<annotation>_rank` (0 on years without contracts).
+    """
+    nif_to_name = dict((str(region['NIF']), region['name'])
+                       for region in regions)
+
+    query = '''
+SELECT contracts_entity.base_id, contracts_entity.nif,
+  contracts_contractsrollup.year,
+  SUM(contracts_contractsrollup.count),
+  SUM(contracts_contractsrollup.price),
+  SUM(contracts_contractsrollup.deltat),
+  SUM(contracts_contractsrollup.depth),
+  SUM(contracts_contractsrollup.good_text)
+FROM contracts_contractsrollup
+  INNER JOIN contracts_entity
+    ON (contracts_contractsrollup.entity_id = contracts_entity.id)
+WHERE contracts_contractsrollup.year >= %%s AND
+      contracts_entity.nif IN (%s)
+GROUP BY contracts_entity.base_id, contracts_entity.nif,
+         contracts_contractsrollup.year
+HAVING SUM(contracts_contractsrollup.count) > 0
+ORDER BY contracts_entity.base_id, contracts_contractsrollup.year
+    ''' % ','.join(["'%s'" % nif for nif in nif_to_name])
+
+    cursor = connection.cursor()
+    cursor.execute(query, [first_year])
+    rows = cursor.fetchall()
+
+    # the entity and year of each row and its position in the arrays.
+    base_ids, entity_index = np.unique(
+        np.array([row[0] for row in rows], dtype=np.int64),
+        return_inverse=True)
+    years, year_index = np.unique(
+        np.array([row[2] for row in rows], dtype=np.int64),
+        return_inverse=True)
+    names = dict((row[0], nif_to_name[row[1]]) for row in rows)
+
+    sums = np.array([row[3:] for row in rows], dtype=np.float64)\
+        .reshape(-1, 5)
+    shape = (len(base_ids), len(years))
+
+    def dense(values, missing):
+        array = np.full(shape, missing, dtype=values.dtype)
+        array[entity_index, year_index] = values
+        return array
+
+    count = sums[:, 0]
+    result = {
+        'base_ids': base_ids.tolist(),
+        'names': [names[base_id] for base_id in base_ids.tolist()],
+        'years': years.tolist(),
+        'count': dense(count.astype(np.int64), 0),
+        'value': dense(sums[:, 1]/100, 0),
+        'avg_deltat': dense(sums[:, 2]/count, np.nan),
+        'avg_specificity': dense(sums[:, 3]/count, np.nan),
+        'avg_good_text': dense(sums[:, 4]/count, np.nan),
+    }
+
+    for metric, descending in METRICS:
+        values = result[metric]
+        ranks = np.zeros(shape, dtype=np.int64)
+        for year in range(len(years)):
+            ranks[:, year] = competition_rank(values[:, year], descending)
+        result[metric + '_rank'] = ranks
+
+    return result
+
+
+def ranking_series(ranking):
+    """
+    Returns a list with the time-series of each entity of `ranking` (see
+    `regions_ranking`), as dictionaries with the `base_id`, the `name` and the
+    `values` of each year.
+    """
+    keys = ['count', 'value']
+    for metric, _ in METRICS:
+        keys += [metric, metric + '_rank']
+    # nested lists of Python numbers, with None on years without contracts.
+    columns = dict((key, np.where(ranking['count'] > 0, ranking[key], None)
+                    .tolist()) for key in keys)
+
+    series = []
+    for index, base_id in enumerate(ranking['base_ids']):
+        values = []
+        for year_index, year in enumerate(ranking['years']):
+            value = dict((key, columns[key][index][year_index])
+                         for key in keys)
+            value['year'] = str(year)
+            if value['count'] is None:
+                value['count'] = value['value'] = 0
+            values.append(value)
+
+        series.append({'base_id': base_id,
+                       'name': ranking['names'][index],
+                       'values': values})
+    return series
+
+
+def municipalities_ranking():
+    from pt_regions import municipalities
+    return regions_ranking(municipalities())
@@ -1,6 +1,7 @@
 import xml.etree.ElementTree
 
 from contracts.models import Category
+from contracts.crawler_forms import lookup_cache
 
 
 def get_xml():
@@ -35,15 +36,27 @@ def _get_depth(code):
     return depth
 
 
-def _get_parent(code):
+def _get_parent_prefixes(code):
+    """
+    Returns the beginnings of the codes of the possible parents of `code`,
+    closest parent first.
+    """
     depth = _get_depth(code)
     s = list(code[:-2])
+    prefixes = []
     while depth != 1:
         s[depth] = '0'  # pick the parent code
+        prefixes.append("".join(s))
+        depth -= 1
+    return prefixes
+
+
+def _get_parent(code):
+    for prefix in _get_parent_prefixes(code):
         try:
-            return Category.objects.get(code__startswith="".join(s))
+            return Category.objects.get(code__startswith=prefix)
         except Category.DoesNotExist:
-            depth -= 1
+            pass
 
     return None  # parent not found
 
@@ -63,10 +76,62 @@ def add_category(data):
     return category
 
 
-def build_categories():
+def _build_tree(data_list):
+    """
+    Returns unsaved categories from a list of data (see `_get_data`) with the
+    nested sets (lft, rgt, depth and tree_id) computed in memory, as
+    `add_category` would build them: the parent of each category is the
+    closest previous one and children are in the order of the list.
+    """
+    children = dict((data['code'], []) for data in data_list)
+    roots = []
+
+    # the beginning of the code of each category -> data
+    prefixes = {}
+    for data in data_list:
+        for prefix in _get_parent_prefixes(data['code']):
+            if prefix in prefixes:
+                children[prefixes[prefix]['code']].append(data)
+                break
+        else:
+            roots.append(data)
+        prefixes[data['code'][:-2]] = data
+
+    categories = []
+
+    def add(data, tree_id, depth, lft):
+        category = Category(tree_id=tree_id, depth=depth, lft=lft, **data)
+        categories.append(category)
+        rgt = lft + 1
+        for child in children[data['code']]:
+            rgt = add(child, tree_id, depth + 1, rgt) + 1
+        category.rgt = rgt
+        return rgt
+
+    for tree_id, data in enumerate(roots, 1):
+        add(data, tree_id, 1, 1)
+
+    return categories
+
+
+def build_categories(root=None):
     """
-    Builds the Categories the xml file. Takes ~2m.
+    Builds the Categories from the xml file (or its parsed `root`).
+
+    When there are no categories, the tree is computed in memory and inserted
+    in bulk; otherwise, only categories that don't exist are added, e.g.
+    from a new revision of CPV.
     """
-    for child in get_xml():
-        data = _get_data(child)
-        add_category(data)
+    if root is None:
+        root = get_xml()
+    data_list = [_get_data(child) for child in root]
+
+    if Category.objects.exists():
+        existing = set(Category.objects.values_list('code', flat=True))
+        for data in data_list:
+            if data['code'] not in existing:
+                add_category(data)
+    else:
+        Category.objects.bulk_create(_build_tree(data_list), batch_size=1000)
+
+    lookup_cache.invalidate(Category)
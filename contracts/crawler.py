@@ -1,16 +1,24 @@
+from collections import deque
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import hashlib
 import json
 import logging
 
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 from django.forms import DateField, CharField
 
 import requests
 import requests.exceptions
 
 from . import models
+from contracts.crawler_scheduler import default_scheduler
 from contracts.crawler_forms import EntityForm, ContractForm, \
-    TenderForm, clean_place, PriceField
+    TenderForm, clean_place, PriceField, EntitiesField, lookup_cache
 
 logger = logging.getLogger(__name__)
 
@@ -23,136 +31,220 @@ class JSONLoadError(Exception):
         self.url = url
 
 
+def iter_json_list(chunks, encoding='utf-8'):
+    """
+    Yields the items of a JSON list from an iterable of `chunks` of bytes,
+    decoding one item at a time so the list is never whole in memory.
+
+    Raises `ValueError` if the content is not a JSON list.
+    """
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+
+    buffer = ''
+    position = 0
+    is_finished = False
+    # what is expected next: '[', the first item or ']', an item, or ',' or ']'
+    state = 'start'
+
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+
+        if position == len(buffer):
+            if is_finished:
+                raise ValueError('Incomplete JSON list')
+            buffer, position, is_finished = _read_chunk(
+                chunks, text_decoder, buffer, position)
+            continue
+
+        char = buffer[position]
+        if state == 'start':
+            if char != '[':
+                raise ValueError('Content is not a JSON list')
+            position += 1
+            state = 'first'
+        elif state == 'separator':
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError('Expected "," in JSON list')
+            position += 1
+            state = 'item'
+        elif state == 'first' and char == ']':
+            return
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                end = None
+            # the item may continue in the next chunk (e.g. a number).
+            if end is None or (end == len(buffer) and not is_finished):
+                if is_finished:
+                    raise ValueError('Invalid item in JSON list')
+                buffer, position, is_finished = _read_chunk(
+                    chunks, text_decoder, buffer, position)
+                continue
+            yield item
+            position = end
+            state = 'separator'
+
+
+def _read_chunk(chunks, text_decoder, buffer, position):
+    """
+    Appends the next chunk to the unread part of `buffer`. Returns the new
+    buffer, position and whether there are no more chunks.
+    """
+    chunk = next(chunks, None)
+    if chunk is None:
+        return buffer[position:] + text_decoder.decode(b'', final=True), 0, \
+            True
+    return buffer[position:] + text_decoder.decode(chunk), 0, False
+
+
 class JSONCrawler:
     """
-    A crawler specific for retrieving JSON content.
+    A crawler specific for retrieving JSON content. If a `store` is given
+    (see `contracts.crawler_store`), responses are stored and replayed from it.
+
+    Requests are sent through a `scheduler` (see `contracts.crawler_scheduler`)
+    that limits concurrent requests and retries failed ones; by default, all
+    crawlers share the same scheduler.
     """
     user_agent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8_5) ' \
                  'AppleWebKit/537.36 (KHTML, like Gecko)'
 
-    def __init__(self):
+    def __init__(self, store=None, scheduler=None):
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': self.user_agent})
+        self.store = store
+        if scheduler is None:
+            scheduler = default_scheduler
+        self.scheduler = scheduler
 
-    def get_response(self, url, headers=None):
+    def _get(self, url, headers=None, **kwargs):
+        # headers are passed per request (and not stored in the session) so the
+        # session can be shared by concurrent requests.
+        return self.scheduler.request(self.session, url, headers, **kwargs)
 
-        if headers:
-            self.session.headers.update(headers)
+    def get_response(self, url, headers=None):
+        """
+        Returns the response of a GET request.
+        """
+        if self.store is not None:
+            return self.store.get_response(self._get, url, headers)
+        return self._get(url, headers)
 
-        return self.session.get(url)
+    def read_response(self, url, read, headers=None):
+        """
+        Returns `read(response)` of a GET request, where the content of the
+        response is streamed (e.g. read with `iter_content`). The request is
+        retried when reading its content fails.
+        """
+        if self.store is not None:
+            # the store keeps the whole content.
+            return read(self.get_response(url, headers))
+        return self._get(url, headers, stream=True, consume=read)
 
     def get_json(self, url, headers=None):
         return json.loads(self.get_response(url, headers).text)
 
 
 class ContractsStaticDataCrawler(JSONCrawler):
-    def save_contracts_types(self):
-        url = 'http://www.base.gov.pt/base2/rest/lista/tipocontratos'
-        data = self.get_json(url)
+    lists_url = 'http://www.base.gov.pt/base2/rest/lista/'
 
-        for element in data['items']:
-            if element['id'] == '0':  # id = 0 is "All" that we don't use.
-                continue
-            try:
-                # if it exists, continue
-                models.ContractType.objects.get(base_id=element['id'])
-            except models.ContractType.DoesNotExist:
-                contract_type = models.ContractType(name=element['description'],
-                                                    base_id=element['id'])
-                contract_type.save()
+    def _sync(self, elements, model, key='base_id', skip_all=True, **values):
+        """
+        Synchronizes `model` with the `elements` of a list of BASE, using one
+        query to retrieve existing instances and one to insert the new ones.
 
-    def save_procedures_types(self):
-        url = 'http://www.base.gov.pt/base2/rest/lista/tipoprocedimentos'
-        data = self.get_json(url)
+        Instances are identified by `key` (`'base_id'` or `'name'`); existing
+        ones whose name changed are renamed. `values` are set on the new
+        instances (e.g. the district of councils). If `skip_all`, the element
+        with id 0, "All", is ignored.
 
-        for element in data['items']:
-            if element['id'] == '0':  # id = 0 is "All that we don't use.
+        Returns the number of created instances.
+        """
+        has_base_id = any(field.name == 'base_id'
+                          for field in model._meta.fields)
+
+        rows = {}
+        for element in elements:
+            if skip_all and element['id'] == '0':
                 continue
-            try:
-                # if it exists, we pass
-                models.ProcedureType.objects.get(name=element['description'])
-            except models.ProcedureType.DoesNotExist:
-                procedure_type = models.ProcedureType(name=element['description'],
-                                                      base_id=element['id'])
-                procedure_type.save()
+            row = {'name': element['description']}
+            if has_base_id:
+                row['base_id'] = int(element['id'])
+            rows[row[key]] = row
 
-    def save_act_types(self):
-        url = 'http://www.base.gov.pt/base2/rest/lista/tiposacto'
+        existing = dict(model.objects.filter(**{key + '__in': list(rows)})
+                        .values_list(key, 'name'))
 
-        data = self.get_json(url)
+        new_instances = []
+        for key_value, row in rows.items():
+            if key_value not in existing:
+                new_instances.append(model(**dict(row, **values)))
+            elif existing[key_value] != row['name']:
+                model.objects.filter(**{key: key_value})\
+                    .update(name=row['name'])
+        model.objects.bulk_create(new_instances)
 
-        for element in data['items']:
-            if element['id'] == '0':  # id = 0 is "All" that we don't use.
-                continue
-            try:
-                # if it exists, we pass
-                models.ActType.objects.get(base_id=element['id'])
-            except models.ActType.DoesNotExist:
-                act_type = models.ActType(name=element['description'],
-                                          base_id=element['id'])
-                act_type.save()
+        lookup_cache.invalidate(model)
 
-    def save_model_types(self):
-        url = 'http://www.base.gov.pt/base2/rest/lista/tiposmodelo'
-        data = self.get_json(url)
+        return len(new_instances)
 
-        for element in data['items']:
-            if element['id'] == '0':  # id = 0 is "All" that we don't use.
-                continue
-            try:
-                # if it exists, we pass
-                models.ModelType.objects.get(base_id=element['id'])
-            except models.ModelType.DoesNotExist:
-                act_type = models.ModelType(name=element['description'],
-                                            base_id=element['id'])
-                act_type.save()
+    def _get_list(self, name):
+        return self.get_json(self.lists_url + name)['items']
 
-    def save_all_countries(self):
-        url = 'http://www.base.gov.pt/base2/rest/lista/paises'
-        data = self.get_json(url)
+    def save_contracts_types(self):
+        self._sync(self._get_list('tipocontratos'), models.ContractType)
 
-        for element in data['items']:
-            try:
-                # if it exists, we pass
-                models.Country.objects.get(name=element['description'])
-                pass
-            except models.Country.DoesNotExist:
-                country = models.Country(name=element['description'])
-                country.save()
+    def save_procedures_types(self):
+        self._sync(self._get_list('tipoprocedimentos'), models.ProcedureType,
+                   key='name')
+
+    def save_act_types(self):
+        self._sync(self._get_list('tiposacto'), models.ActType)
+
+    def save_model_types(self):
+        self._sync(self._get_list('tiposmodelo'), models.ModelType)
+
+    def save_all_countries(self):
+        self._sync(self._get_list('paises'), models.Country, key='name',
+                   skip_all=False)
 
     def save_all_districts(self):
-        base_url = 'http://www.base.gov.pt/base2/rest/lista/distritos?pais=%d'
         portugal = models.Country.objects.get(name="Portugal")
 
-        data = self.get_json(base_url % 187)
+        self._sync(self._get_list('distritos?pais=187'), models.District,
+                   country=portugal)
 
-        for element in data['items']:
-            if element['id'] == '0':  # id = 0 is "All" that we don't use.
-                continue
-            try:
-                # if it exists, we pass
-                models.District.objects.get(base_id=element['id'])
-            except models.District.DoesNotExist:
-                district = models.District(name=element['description'],
-                                           base_id=element['id'],
-                                           country=portugal)
-                district.save()
-
-    def save_councils(self, district):
-        base_url = 'http://www.base.gov.pt/base2/rest/lista/concelhos?distrito=%d'
-        data = self.get_json(base_url % district.base_id)
-
-        for element in data['items']:
-            if element['id'] == '0':  # id = 0 is "All", that we don't use.
-                continue
-            try:
-                # if it exists, we pass
-                models.Council.objects.get(base_id=element['id'])
-            except models.Council.DoesNotExist:
-                council = models.Council(name=element['description'],
-                                         base_id=element['id'],
-                                         district=district)
-                council.save()
+    def save_councils(self, district, elements=None):
+        """
+        Saves the councils of `district` from its list of BASE (`elements`),
+        retrieving it if not given.
+        """
+        if elements is None:
+            elements = self._get_list('concelhos?distrito=%d' %
+                                      district.base_id)
+        self._sync(elements, models.Council, district=district)
+
+    def save_all_councils(self, workers=8):
+        """
+        Saves the councils of all districts, retrieving the lists of councils
+        using up to `workers` concurrent requests.
+        """
+        districts = list(models.District.objects.all())
+
+        def get_councils(district):
+            return self._get_list('concelhos?distrito=%d' % district.base_id)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            lists = list(executor.map(get_councils, districts))
+
+        for district, elements in zip(districts, lists):
+            self.save_councils(district, elements)
 
     def retrieve_and_save_all(self):
         self.save_contracts_types()
@@ -164,8 +256,7 @@ class ContractsStaticDataCrawler(JSONCrawler):
         # Districts second
         self.save_all_districts()
         # Councils third
-        for district in models.District.objects.all():
-            self.save_councils(district)
+        self.save_all_councils()
 
 
 class DynamicCrawler(JSONCrawler):
@@ -174,6 +265,14 @@ class DynamicCrawler(JSONCrawler):
     object_name = None
     object_model = None
 
+    # keys of the data of an object with lists of entities (see `_prepare_data`)
+    entities_keys = ()
+
+    # lease of a shard (see `claim_shard`), renewed after each batch...
+    shard_lease = datetime.timedelta(minutes=10)
+    # ...and the number of times a shard is claimed before it is given up.
+    max_shard_attempts = 3
+
     def get_json(self, url, headers=None):
         """
         Raises a `JSONLoadError` if all entries are `None`,
@@ -209,7 +308,92 @@ class DynamicCrawler(JSONCrawler):
 
         return instance, (action == 'created')
 
+    def save_instances(self, cleaned_data_list):
+        """
+        Saves or updates the instances using a list of cleaned_data, with one
+        query to retrieve existing instances, one bulk insert for the new ones
+        and one update for each existing one.
+
+        Returns a list of tuples `(instance, created)`, in the order of
+        `cleaned_data_list`.
+        """
+        base_ids = [cleaned_data['base_id'] for cleaned_data in cleaned_data_list]
+
+        existing = dict((instance.base_id, instance) for instance in
+                        self.object_model.objects.filter(base_id__in=base_ids))
+
+        new_instances = []
+        for cleaned_data in cleaned_data_list:
+            if cleaned_data['base_id'] in existing:
+                instance = existing[cleaned_data['base_id']]
+                for (key, value) in cleaned_data.items():
+                    setattr(instance, key, value)
+                instance.save()
+            else:
+                new_instances.append(self.object_model(**cleaned_data))
+        self.object_model.objects.bulk_create(new_instances)
+
+        logger.info('%d %s created, %d updated' % (
+            len(new_instances), self.object_name,
+            len(base_ids) - len(new_instances)))
+
+        # bulk_create does not set primary keys: retrieve all instances again.
+        instances = dict((instance.base_id, instance) for instance in
+                         self.object_model.objects.filter(base_id__in=base_ids))
+
+        return [(instances[base_id], base_id not in existing)
+                for base_id in base_ids]
+
+    def _save_m2m(self, field_name, instances, values):
+        """
+        Sets the many-to-many relation `field_name` of each instance in
+        `instances` to the respective list of objects in `values` using one
+        query to retrieve, one to delete and one to insert relations.
+
+        Returns the set of ids of all objects that were or are now related to
+        `instances`.
+        """
+        field = self.object_model._meta.get_field(field_name)
+        through = field.rel.through
+        source = field.m2m_column_name()
+        target = field.m2m_reverse_name()
+
+        existing = {}
+        for pk, source_id, target_id in through.objects.filter(
+                **{source + '__in': [instance.id for instance in instances]})\
+                .values_list('id', source, target):
+            existing[(source_id, target_id)] = pk
+
+        wanted = set()
+        for instance, objects in zip(instances, values):
+            for obj in objects:
+                wanted.add((instance.id, obj.id))
+
+        removed = [existing[pair] for pair in set(existing) - wanted]
+        if removed:
+            through.objects.filter(id__in=removed).delete()
+
+        through.objects.bulk_create([
+            through(**{source: source_id, target: target_id})
+            for source_id, target_id in wanted - set(existing)])
+
+        return set(target_id for _, target_id in set(existing) | wanted)
+
     @transaction.atomic
+    def save_data(self, data, fingerprint=None):
+        """
+        Cleans data retrieved from BASE and saves it as an instance of a Django
+        model, optionally with the `fingerprint` of its entry in BASE's list.
+
+        Returns the output of `save_instance`.
+        """
+        # entities missing in the data are retrieved like it.
+        with EntitiesField.source_crawler(self):
+            cleaned_data = self.clean_data(data)
+        if fingerprint is not None:
+            cleaned_data['fingerprint'] = fingerprint
+        return self.save_instance(cleaned_data)
+
     def update_instance(self, base_id):
         """
         Retrieves data of object base_id from BASE,
@@ -218,8 +402,30 @@ class DynamicCrawler(JSONCrawler):
         Returns the instance
         """
         data = self.get_json(self.object_url % base_id)
-        cleaned_data = self.clean_data(data)
-        return self.save_instance(cleaned_data)
+        return self.save_data(data)
+
+    def get_instances_data(self, base_ids, workers=1, ignore_missing=False):
+        """
+        Retrieves data of objects `base_ids` from BASE using up to `workers`
+        concurrent requests.
+
+        Returns a list with the data of each object, in the order of `base_ids`.
+        If `ignore_missing` is true, the data of objects that don't exist in
+        BASE is `None` instead of raising `JSONLoadError`.
+        """
+        def get_data(base_id):
+            try:
+                return self.get_json(self.object_url % base_id)
+            except JSONLoadError:
+                if ignore_missing:
+                    return None
+                raise
+
+        if workers <= 1:
+            return [get_data(base_id) for base_id in base_ids]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(get_data, base_ids))
 
     def get_instances_count(self):
         """
@@ -247,49 +453,240 @@ class DynamicCrawler(JSONCrawler):
         """
         raise NotImplementedError
 
-    def get_base_ids(self, row1, row2):
-
-        items = self.get_json(self.object_list_url,
-                              headers={'Range': 'items=%d-%d' % (row1, row2)})
-
-        return [self._hasher(instance) for instance in items]
+    @staticmethod
+    def _fingerprint(instance):
+        """
+        Returns a hash of the whole entry of BASE response, so a change in any
+        of its values (e.g. contractors, place) is identified.
+        """
+        normalized = json.dumps(instance, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
 
-    def _update_batch(self, row1, row2):
+    def get_base_ids(self, row1, row2):
+        """
+        Returns the tuples of `_hasher` of the items from row1 to row2 of BASE,
+        each with the `_fingerprint` of the item appended.
         """
-        Updates items from row1 to row2 of BASE db with our db.
+        # items are decoded one at a time from the streamed response, so only
+        # their tuples are kept in memory.
+        def read(response):
+            items = iter_json_list(response.iter_content(64*1024),
+                                   response.encoding or 'utf-8')
+            return [self._hasher(instance) + (self._fingerprint(instance),)
+                    for instance in items]
+
+        return self.read_response(
+            self.object_list_url, read,
+            headers={'Range': 'items=%d-%d' % (row1, row2)})
+
+    def _update_batch(self, row1, row2, workers=1, bulk=False, items=None):
         """
-        c1s = self.get_base_ids(row1, row2)
+        Updates items from row1 to row2 of BASE db with our db. `items` are the
+        output of `get_base_ids(row1, row2)`, when already retrieved.
+
+        Data of changed items is retrieved using `workers` concurrent requests,
+        and saved in order, each in its own transaction. If `bulk` is true,
+        changed items are instead saved together using `save_instances` in a
+        single transaction.
+        """
+        if items is None:
+            items = self.get_base_ids(row1, row2)
+        if not items:
+            return {'deleted': 0, 'added': 0, 'updated': 0}
+        c1s = items
 
         c2s = set(self.object_model.objects.filter(base_id__gte=c1s[0][0],
                                                    base_id__lte=c1s[-1][0])
-                  .order_by('base_id').values_list(*self._values_list()))
+                  .order_by('base_id')
+                  .values_list(*(self._values_list() + ('fingerprint',))))
         c1s = set(c1s)
+        fingerprints = dict((item[0], item[-1]) for item in c1s)
+
+        # items saved without their entry of the list (e.g. entities retrieved
+        # with a contract, see `_prepare_data`) whose values did not change
+        # only miss the fingerprint: it is stored, and they are not retrieved.
+        unfingerprinted = dict((item[:-1], item) for item in c2s
+                               if item[-1] is None)
+        for item in c1s - c2s:
+            if item[:-1] in unfingerprinted:
+                self.object_model.objects.filter(base_id=item[0])\
+                    .update(fingerprint=item[-1])
+                c2s.remove(unfingerprinted[item[:-1]])
+                c2s.add(item)
 
         # just the ids
         c1_ids = set(item[0] for item in c1s)
         c2_ids = set(item[0] for item in c2s)
 
         aggregated_modifications = {'deleted': 0, 'added': 0, 'updated': 0}
-        for item in c1s - c2s:
-            id1 = item[0]
-            self.update_instance(id1)
+
+        changed_ids = sorted(item[0] for item in c1s - c2s)
+        changed_data = self.get_instances_data(changed_ids, workers)
+        self._prepare_data(changed_data, workers)
+        if bulk:
+            cleaned_data_list = []
+            with EntitiesField.source_crawler(self):
+                for data in changed_data:
+                    cleaned_data = self.clean_data(data)
+                    cleaned_data['fingerprint'] = fingerprints[data['id']]
+                    cleaned_data_list.append(cleaned_data)
+            with transaction.atomic():
+                self.save_instances(cleaned_data_list)
+        else:
+            for data in changed_data:
+                self.save_data(data, fingerprints[data['id']])
+
+        for id1 in changed_ids:
             if id1 in c2_ids:
                 aggregated_modifications['updated'] += 1
             else:
                 aggregated_modifications['added'] += 1
 
-        for id2 in c2_ids - c1_ids:
-            self.object_model.objects.get(base_id=id2).delete()
-            logger.info('contract "%d" deleted' % id2)
-            aggregated_modifications['deleted'] += 1
+        deleted_ids = c2_ids - c1_ids
+        if deleted_ids:
+            self.object_model.objects.filter(base_id__in=deleted_ids).delete()
+            logger.info('%d %s deleted: %s' % (len(deleted_ids), self.object_name,
+                                               sorted(deleted_ids)))
+            aggregated_modifications['deleted'] += len(deleted_ids)
+
+        self._finish_batch(c1s ^ c2s)
+
         return aggregated_modifications
 
-    def update(self, start=0, end=None, items_per_batch=1000):
+    def _prepare_data(self, data_list, workers=1):
+        """
+        Called with the data retrieved from BASE of the changed items of a
+        batch before they are cleaned. By default, retrieves and saves the
+        entities referenced in `entities_keys` of the data that are not in our
+        database, using `workers` concurrent requests, so they are not
+        retrieved one by one while the data is cleaned.
+        """
+        base_ids = set(item['id'] for data in data_list
+                       for key in self.entities_keys
+                       for item in data.get(key) or [])
+        if not base_ids:
+            return
+
+        base_ids -= set(models.Entity.objects.filter(base_id__in=base_ids)
+                        .values_list('base_id', flat=True))
+        if not base_ids:
+            return
+
+        crawler = EntitiesCrawler(self.store, self.scheduler)
+        crawler.session = self.session
+
+        cleaned_data_list = []
+        for data in crawler.get_instances_data(sorted(base_ids), workers,
+                                               ignore_missing=True):
+            # entities that fail are left for the validation of the items.
+            if data is None:
+                continue
+            try:
+                cleaned_data_list.append(crawler.clean_data(data))
+            except ValidationError:
+                continue
+
+        if cleaned_data_list:
+            with transaction.atomic():
+                crawler.save_instances(cleaned_data_list)
+
+    def _finish_batch(self, changed_items):
+        """
+        Called after each batch is synchronized with the set of tuples (see
+        `_hasher`) of the items that were added, updated or deleted.
+        Overwrite to e.g. update data that depends on the items.
+        """
+        pass
+
+    def _get_checkpoint(self, requested_start, start, end, resume):
+        """
+        Returns the checkpoint of a synchronization requested from
+        `requested_start` (e.g. -2000) that covers rows `start` to `end`.
+        If `resume` is true and the last synchronization from
+        `requested_start` was interrupted, its checkpoint is continued; if it
+        finished, it is returned finished when it covered until `end` and is
+        otherwise continued until `end`. If not, a new one is started.
+        """
+        try:
+            checkpoint = models.CrawlerCheckpoint.objects.get(
+                object_name=self.object_name, start=requested_start)
+        except models.CrawlerCheckpoint.DoesNotExist:
+            checkpoint = models.CrawlerCheckpoint(object_name=self.object_name,
+                                                  start=requested_start)
+            resume = False
+
+        if resume and checkpoint.is_finished and checkpoint.end == end:
+            logger.info('update of \'%s\' already finished.' %
+                        self.object_name)
+            return checkpoint
+        if resume and checkpoint.position <= end:
+            logger.info('update of \'%s\' resumed from row %d.' %
+                        (self.object_name, checkpoint.position))
+            checkpoint.is_finished = False
+        else:
+            checkpoint.position = start
+            checkpoint.added = checkpoint.updated = checkpoint.deleted = 0
+            checkpoint.is_finished = False
+        checkpoint.end = end
+        return checkpoint
+
+    def _update_range(self, start, end, items_per_batch=1000, workers=1,
+                      bulk=False, prefetch=0):
+        """
+        Synchronizes rows `start` to `end` of BASE in batches of
+        `items_per_batch` (see `update`). Yields the row until which the
+        synchronization is completed and the modifications of each batch.
+        """
+        # + 1 because it is [start, end]
+        total_items = end - start
+
+        # 103 // 100 = 1; we want 2 to also get the 3 in the next batch.
+        batches = total_items // items_per_batch + 1
+
+        logger.info('update of \'%s\' started: %d items in %d batches.' %
+                    (self.object_name, total_items, batches))
+
+        ranges = [(start + i*items_per_batch,
+                   min(end, start + (i+1)*items_per_batch))
+                  for i in range(batches)]
+
+        # lists of items being retrieved, in the order of `ranges`.
+        prefetched = deque()
+
+        # static data is resolved from memory during the update.
+        with lookup_cache, \
+                ThreadPoolExecutor(max_workers=prefetch + 1) as executor:
+            for i, (row1, row2) in enumerate(ranges):
+                while len(prefetched) < prefetch + 1 and \
+                        i + len(prefetched) < batches:
+                    prefetched.append(executor.submit(
+                        self.get_base_ids, *ranges[i + len(prefetched)]))
+
+                logger.info('Batch %d/%d started.' % (i + 1, batches))
+
+                batch_aggr = self._update_batch(
+                    row1, row2, workers, bulk,
+                    items=prefetched.popleft().result())
+
+                logger.info('Batch %d/%d finished: %s' %
+                            (i + 1, batches, batch_aggr))
+
+                yield row2, batch_aggr
+
+    def update(self, start=0, end=None, items_per_batch=1000, workers=1,
+               bulk=False, resume=False, prefetch=0):
         """
         The method retrieves count of all items in BASE (1 hit), and
         synchronizes items from `start` until `min(end, count)` in batches
         of `items_per_batch`.
 
+        The items of each batch are retrieved from BASE using `workers`
+        concurrent requests. If `bulk` is true, they are saved using
+        `save_instances` in one transaction per batch.
+
+        The lists of items of the next `prefetch` batches are retrieved from
+        BASE in the background while a batch is synchronized.
+
         If `end=None` (default), it retrieves until the last item.
 
         if `start < 0`, the start is counted from the end.
@@ -298,8 +695,17 @@ class DynamicCrawler(JSONCrawler):
 
         Use `start=0` (default) to synchronize all items in database
         (it takes time!)
+
+        The progress is stored in a `CrawlerCheckpoint` after each batch. If
+        `resume` is true, an interrupted synchronization from the same `start`
+        continues from its last completed batch, and a finished one only
+        synchronizes the rows added since it finished (if any).
+
+        Returns the modifications of the synchronization, including the ones
+        made before it was resumed.
         """
         aggregated = {'deleted': 0, 'added': 0, 'updated': 0}
+        requested_start = start
 
         count = self.get_instances_count()
         if end is None:
@@ -316,30 +722,172 @@ class DynamicCrawler(JSONCrawler):
         if start > end:
             return aggregated
 
-        # + 1 because it is [start, end]
-        total_items = end - start
+        checkpoint = self._get_checkpoint(requested_start, start, end, resume)
+        start = checkpoint.position
+        for key in aggregated:
+            aggregated[key] = getattr(checkpoint, key)
+        if checkpoint.is_finished:
+            return aggregated
+        checkpoint.save()
 
-        # 103 // 100 = 1; we want 2 to also get the 3 in the next batch.
-        batches = total_items // items_per_batch + 1
+        for position, batch_aggr in self._update_range(
+                start, end, items_per_batch, workers, bulk, prefetch):
+            for key in aggregated:
+                aggregated[key] += batch_aggr[key]
+                setattr(checkpoint, key, aggregated[key])
+            checkpoint.position = position
+            checkpoint.save()
 
-        logger.info('update of \'%s\' started: %d items in %d batches.' %
-                    (self.object_name, total_items, batches))
+        checkpoint.is_finished = True
+        checkpoint.save()
 
-        for i in range(batches):
-            logger.info('Batch %d/%d started.' % (i + 1, batches))
+        logger.info('update of \'%s\' finished: %s' %
+                    (self.object_name, aggregated))
 
-            batch_aggr = self._update_batch(
-                start + i*items_per_batch,
-                min(end, start + (i+1)*items_per_batch))
+        return aggregated
 
-            logger.info('Batch %d/%d finished: %s' % (i + 1, batches, batch_aggr))
+    def create_shards(self, shard_size=10000, reset=False):
+        """
+        Splits all rows of BASE in shards of `shard_size` rows to be
+        synchronized by `work`. Existing shards are kept (so any number of
+        workers can call this), except that the last one is extended to the
+        current count of BASE. If `reset` is true, existing shards are first
+        deleted; use it before starting a new synchronization.
 
-            for key in aggregated:
-                aggregated[key] += batch_aggr[key]
+        Returns the number of created shards.
+        """
+        if reset:
+            models.CrawlerShard.objects.filter(
+                object_name=self.object_name).delete()
 
-        logger.info('update of \'%s\' finished: %s' %
-                    (self.object_name, aggregated))
+        count = self.get_instances_count()
 
+        created = 0
+        for start in range(0, count, shard_size):
+            end = min(count, start + shard_size)
+            shard, is_new = models.CrawlerShard.objects.get_or_create(
+                object_name=self.object_name, start=start,
+                defaults={'end': end})
+            if is_new:
+                created += 1
+            elif shard.end < end:
+                models.CrawlerShard.objects\
+                    .filter(pk=shard.pk)\
+                    .exclude(status=models.CrawlerShard.RUNNING)\
+                    .update(end=end, status=models.CrawlerShard.PENDING,
+                            attempts=0)
+        return created
+
+    def claim_shard(self, worker):
+        """
+        Leases the first shard that is pending or whose lease expired to
+        `worker` (a name). Returns the shard or None if no shard is left.
+        """
+        now = timezone.now()
+        shards = models.CrawlerShard.objects.filter(
+            object_name=self.object_name)
+
+        # shards that were claimed too many times are given up.
+        shards.filter(status=models.CrawlerShard.RUNNING, lease_expires__lt=now,
+                      attempts__gte=self.max_shard_attempts)\
+            .update(status=models.CrawlerShard.FAILED)
+
+        candidates = shards.filter(
+            Q(status=models.CrawlerShard.PENDING) |
+            Q(status=models.CrawlerShard.RUNNING, lease_expires__lt=now))\
+            .filter(attempts__lt=self.max_shard_attempts).order_by('start')
+
+        for shard in candidates:
+            # each claim increments `attempts`: if another worker claimed the
+            # shard in the meanwhile, this update does not match it.
+            claimed = models.CrawlerShard.objects.filter(
+                pk=shard.pk, status=shard.status, attempts=shard.attempts)\
+                .update(status=models.CrawlerShard.RUNNING, worker=worker,
+                        lease_expires=now + self.shard_lease, heartbeat=now,
+                        attempts=shard.attempts + 1)
+            if claimed:
+                return models.CrawlerShard.objects.get(pk=shard.pk)
+        return None
+
+    def _renew_shard(self, shard, **values):
+        """
+        Updates the shard leased by this worker with `values`. Returns False if
+        the lease was lost to another worker.
+        """
+        return models.CrawlerShard.objects.filter(
+            pk=shard.pk, worker=shard.worker, attempts=shard.attempts,
+            status=models.CrawlerShard.RUNNING).update(**values) == 1
+
+    def update_shard(self, shard, items_per_batch=1000, workers=1, bulk=False,
+                     prefetch=0):
+        """
+        Synchronizes the rows of a shard claimed with `claim_shard`, renewing
+        its lease after each batch. On error, the shard is released to be
+        retried and the error is raised.
+
+        Returns the aggregated modifications.
+        """
+        aggregated = {'deleted': 0, 'added': 0, 'updated': 0}
+
+        # ranges of `_update_range` include their last row, while shards don't:
+        # row `end` is the first row of the next shard.
+        batches = self._update_range(shard.start, shard.end - 1,
+                                     items_per_batch, workers, bulk, prefetch)
+        try:
+            for _, batch_aggr in batches:
+                for key in aggregated:
+                    aggregated[key] += batch_aggr[key]
+
+                now = timezone.now()
+                if not self._renew_shard(
+                        shard, lease_expires=now + self.shard_lease,
+                        heartbeat=now, **aggregated):
+                    logger.warning('lease of shard %d of \'%s\' lost.' %
+                                   (shard.start, self.object_name))
+                    return aggregated
+        except Exception:
+            if shard.attempts >= self.max_shard_attempts:
+                status = models.CrawlerShard.FAILED
+            else:
+                status = models.CrawlerShard.PENDING
+            self._renew_shard(shard, status=status, lease_expires=None)
+            raise
+        finally:
+            batches.close()
+
+        self._renew_shard(shard, status=models.CrawlerShard.FINISHED,
+                          lease_expires=None)
+        return aggregated
+
+    def work(self, worker, items_per_batch=1000, workers=1, bulk=False,
+             prefetch=0):
+        """
+        Claims and synchronizes shards (see `create_shards`) until none is
+        left. Errors of a shard are logged and the next shard is claimed.
+
+        Returns the aggregated modifications.
+        """
+        aggregated = {'deleted': 0, 'added': 0, 'updated': 0}
+        while True:
+            shard = self.claim_shard(worker)
+            if shard is None:
+                break
+
+            logger.info('shard %d-%d of \'%s\' claimed by %s.' %
+                        (shard.start, shard.end, self.object_name, worker))
+            try:
+                shard_aggr = self.update_shard(shard, items_per_batch, workers,
+                                               bulk, prefetch)
+            except Exception:
+                logger.exception('shard %d-%d of \'%s\' failed.' %
+                                 (shard.start, shard.end, self.object_name))
+                continue
+
+            for key in aggregated:
+                aggregated[key] += shard_aggr[key]
+
+        logger.info('work of %s on \'%s\' finished: %s' %
+                    (worker, self.object_name, aggregated))
         return aggregated
 
 
@@ -384,6 +932,11 @@ class ContractsCrawler(DynamicCrawler):
     object_list_url = 'http://www.base.gov.pt/base2/rest/contratos'
     object_name = 'contract'
     object_model = models.Contract
+    entities_keys = ('contracting', 'contracted')
+
+    # whether to compute the data of entities after each batch
+    # (see `models.compute_entities_data`)
+    update_entities_data = False
 
     @staticmethod
     def clean_data(data):
@@ -438,6 +991,35 @@ class ContractsCrawler(DynamicCrawler):
 
         return contract, created
 
+    def save_instances(self, cleaned_data_list):
+        """
+        Saves contracts and their relations in bulk. The data of the entities
+        of the contracts is invalidated once per entity.
+        """
+        contractors = [cleaned_data.pop('contractors')
+                       for cleaned_data in cleaned_data_list]
+        contracted = [cleaned_data.pop('contracted')
+                      for cleaned_data in cleaned_data_list]
+        results = super(ContractsCrawler, self).save_instances(cleaned_data_list)
+
+        contracts = [contract for contract, _ in results]
+        entities_ids = self._save_m2m('contractors', contracts, contractors) | \
+            self._save_m2m('contracted', contracts, contracted)
+
+        models.invalidate_entities_data(entities_ids)
+
+        return results
+
+    def _finish_batch(self, changed_items):
+        # the signing dates of changed contracts, before and after the change,
+        # are the months of the rollup that changed.
+        models.update_contracts_rollup(
+            (item[2].year, item[2].month) for item in changed_items
+            if item[2] is not None)
+
+        if self.update_entities_data:
+            models.compute_entities_data()
+
     def _hasher(self, instance):
         date_field = DateField(input_formats=["%d-%m-%Y"], required=False)
         return instance['id'], \
@@ -456,6 +1038,7 @@ class TendersCrawler(DynamicCrawler):
     object_list_url = 'http://www.base.gov.pt/base2/rest/anuncios'
     object_name = 'tender'
     object_model = models.Tender
+    entities_keys = ('contractingEntities',)
 
     @staticmethod
     def clean_data(data):
@@ -492,6 +1075,16 @@ class TendersCrawler(DynamicCrawler):
 
         return tender, created
 
+    def save_instances(self, cleaned_data_list):
+        contractors = [cleaned_data.pop('contractors')
+                       for cleaned_data in cleaned_data_list]
+        results = super(TendersCrawler, self).save_instances(cleaned_data_list)
+
+        self._save_m2m('contractors', [tender for tender, _ in results],
+                       contractors)
+
+        return results
+
     def _hasher(self, instance):
         date_field = DateField(input_formats=["%d-%m-%Y"])
 
@@ -1,6 +1,8 @@
+from contextlib import contextmanager
 import datetime
 from datetime import timedelta
 import re
+import threading
 
 from django.core.exceptions import ValidationError
 from django.db import transaction
@@ -33,6 +35,109 @@ def clean_place(value):
     return tuple(place)
 
 
+class LookupCache:
+    """
+    Caches in memory the rows of the small tables used to validate data from
+    BASE (countries, districts, councils, types and categories), indexed by
+    the fields used to look them up, so each table is retrieved once per crawl.
+
+    The cache is only used while active, i.e. inside a ``with`` block::
+
+        with lookup_cache:
+            ...  # fields resolve against the cache
+
+    and is cleared when the outermost block exits. Use :meth:`invalidate` when
+    rows are added to a table.
+    """
+    def __init__(self):
+        self._tables = {}
+        # the models each table depends on, e.g. councils by district name
+        # depend on districts.
+        self._models = {}
+        self._depth = 0
+
+    def __enter__(self):
+        self._depth += 1
+        return self
+
+    def __exit__(self, *args):
+        self._depth -= 1
+        if self._depth == 0:
+            self.invalidate()
+
+    @property
+    def is_active(self):
+        return self._depth > 0
+
+    @staticmethod
+    def _value(instance, field):
+        for name in field.split('__'):
+            instance = getattr(instance, name)
+        return instance
+
+    @staticmethod
+    def _related_models(model, fields):
+        """
+        Returns the set of `model` and the models whose fields `fields` follow.
+        """
+        result = {model}
+        for field in fields if isinstance(fields, tuple) else (fields,):
+            related = model
+            for name in field.split('__')[:-1]:
+                related = related._meta.get_field(name).rel.to
+                result.add(related)
+        return result
+
+    def get(self, queryset, fields, value):
+        """
+        Returns the instance of `queryset` whose `fields` are equal to `value`.
+        `fields` is a field name (e.g. `'name'`) or a tuple of them, following
+        relations with `__`, in which case `value` must be a tuple.
+
+        Raises `DoesNotExist` of the model if no instance matches and
+        `MultipleObjectsReturned` if more than one does, like `queryset.get`.
+        """
+        key = (queryset.model, fields)
+        if key not in self._tables:
+            table = {}
+            for instance in queryset.all():
+                if isinstance(fields, tuple):
+                    instance_value = tuple(self._value(instance, field)
+                                           for field in fields)
+                else:
+                    instance_value = self._value(instance, fields)
+                # values of more than one instance are stored as `None`.
+                table[instance_value] = \
+                    None if instance_value in table else instance
+            self._tables[key] = table
+            self._models[key] = self._related_models(queryset.model, fields)
+
+        try:
+            instance = self._tables[key][value]
+        except KeyError:
+            raise queryset.model.DoesNotExist(
+                '%s with %s=%s does not exist.' %
+                (queryset.model.__name__, fields, value))
+        if instance is None:
+            raise queryset.model.MultipleObjectsReturned(
+                'More than one %s with %s=%s.' %
+                (queryset.model.__name__, fields, value))
+        return instance
+
+    def invalidate(self, model=None):
+        """
+        Removes the tables of `model`, and the ones looked up by fields of
+        `model`, from the cache, or all tables if `model` is `None`.
+        """
+        for key in list(self._tables):
+            if model is None or model in self._models[key]:
+                del self._tables[key]
+                del self._models[key]
+
+
+lookup_cache = LookupCache()
+
+
 class PriceField(IntegerField):
     """
     Validates BASE prices
@@ -80,14 +185,62 @@ class CPVSField(CharField):
             raise ValidationError('CPV "%s" not correct', value)
 
 
+class CachedModelChoiceField(ModelChoiceField):
+    """
+    A ``ModelChoiceField`` that, during a crawl, resolves values against the
+    ``lookup_cache`` instead of hitting the database.
+    """
+    def to_python(self, value):
+        if not lookup_cache.is_active:
+            return super().to_python(value)
+
+        if value in self.empty_values:
+            return None
+        try:
+            return lookup_cache.get(self.queryset,
+                                    self.to_field_name or 'pk', value)
+        except self.queryset.model.DoesNotExist:
+            raise ValidationError(self.error_messages['invalid_choice'],
+                                  code='invalid_choice')
+
+
 class EntitiesField(ModelMultipleChoiceField):
     """
     Validates multiple entities based on BASE data.
     """
+    # per thread, the crawler whose data is validated (see `source_crawler`).
+    _local = threading.local()
+
     def __init__(self, **kwargs):
         super().__init__(queryset=models.Entity.objects,
                          to_field_name='base_id', **kwargs)
 
+    @classmethod
+    @contextmanager
+    def source_crawler(cls, crawler):
+        """
+        Inside this ``with`` block, missing entities are retrieved with the
+        response store, scheduler and session of `crawler`, so e.g. an offline
+        replay does not hit BASE.
+        """
+        previous = getattr(cls._local, 'crawler', None)
+        cls._local.crawler = crawler
+        try:
+            yield
+        finally:
+            cls._local.crawler = previous
+
+    @classmethod
+    def get_crawler(cls):
+        import contracts.crawler
+        source = getattr(cls._local, 'crawler', None)
+        if source is None:
+            return contracts.crawler.EntitiesCrawler()
+        crawler = contracts.crawler.EntitiesCrawler(source.store,
+                                                    source.scheduler)
+        crawler.session = source.session
+        return crawler
+
     def clean(self, value):
         value = [item['id'] for item in value]
 
@@ -96,12 +249,15 @@ class EntitiesField(ModelMultipleChoiceField):
         except ValidationError:
             # in case we don't have the entity, we try to retrieve it from BASE.
             import contracts.crawler
-            entity_crawler = contracts.crawler.EntitiesCrawler()
+            entity_crawler = self.get_crawler()
 
+            existing = set(models.Entity.objects.filter(base_id__in=value)
+                           .values_list('base_id', flat=True))
             try:
                 with transaction.atomic():
                     for base_id in value:
-                        entity_crawler.update_instance(base_id)
+                        if base_id not in existing:
+                            entity_crawler.update_instance(base_id)
             except (contracts.crawler.JSONLoadError, ValidationError):
                 raise ValidationError("An entity in %s doesn't exist in BASE." %
                                       value)
@@ -109,7 +265,7 @@ class EntitiesField(ModelMultipleChoiceField):
             return super().clean(value)
 
 
-class CountryChoiceField(ModelChoiceField):
+class CountryChoiceField(CachedModelChoiceField):
     """
     Validates a relation to a ``models.Country``.
     """
@@ -133,10 +289,14 @@ class CouncilChoiceField(Field):
         district = value['district']
         council = value['council']
 
+        if lookup_cache.is_active:
+            return lookup_cache.get(
+                models.Council.objects.select_related('district'),
+                ('name', 'district__name'), (council, district))
         return models.Council.objects.get(name=council, district__name=district)
 
 
-class CategoryField(ModelChoiceField):
+class CategoryField(CachedModelChoiceField):
     """
     Validates a relation to a ``models.Category``.
     """
@@ -155,7 +315,7 @@ class CategoryField(ModelChoiceField):
             return None
 
 
-class ContractTypeField(ModelChoiceField):
+class ContractTypeField(CachedModelChoiceField):
     """
     Validates a relation to a ``models.ContractType``.
     """
@@ -203,17 +363,18 @@ class ContractForm(Form):
 
     cpvs = CPVSField(required=False)
     category = CategoryField(required=False)
-    procedure_type = ModelChoiceField(queryset=models.ProcedureType.objects,
-                                      to_field_name='name', required=False)
+    procedure_type = CachedModelChoiceField(
+        queryset=models.ProcedureType.objects, to_field_name='name',
+        required=False)
     contract_type = ContractTypeField(required=False)
 
     contractors = EntitiesField()
     contracted = EntitiesField()
 
-    country = ModelChoiceField(queryset=models.Country.objects,
-                               to_field_name='name', required=False)
-    district = ModelChoiceField(queryset=models.District.objects,
-                                to_field_name='name', required=False)
+    country = CachedModelChoiceField(queryset=models.Country.objects,
+                                     to_field_name='name', required=False)
+    district = CachedModelChoiceField(queryset=models.District.objects,
+                                      to_field_name='name', required=False)
     council = CouncilChoiceField(required=False)
 
 
@@ -228,10 +389,10 @@ class TenderForm(Form):
     cpvs = CPVSField(required=False)
     category = CategoryField(required=False)
 
-    act_type = ModelChoiceField(queryset=models.ActType.objects,
-                                to_field_name='name', required=False)
-    model_type = ModelChoiceField(queryset=models.ModelType.objects,
-                                  to_field_name='name', required=False)
+    act_type = CachedModelChoiceField(queryset=models.ActType.objects,
+                                      to_field_name='name', required=False)
+    model_type = CachedModelChoiceField(queryset=models.ModelType.objects,
+                                        to_field_name='name', required=False)
     contract_type = ContractTypeField(required=False)
 
     announcement_number = CharField(required=False)
@@ -0,0 +1,197 @@
+"""
+Schedules requests to BASE: limits and adapts the number of concurrent
+requests per host, retries failed requests and stops hitting a host that keeps
+failing.
+"""
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests.exceptions
+
+logger = logging.getLogger(__name__)
+
+
+class _Host:
+    """
+    The state of the requests to a host.
+    """
+    def __init__(self, concurrency):
+        self.condition = threading.Condition()
+        # the number of requests allowed to run concurrently (see
+        # `RequestScheduler`) and the number of requests running.
+        self.limit = concurrency
+        self.running = 0
+
+        # consecutive failed requests and, when the circuit is open, the time
+        # until which requests are not sent.
+        self.failures = 0
+        self.open_until = None
+        # whether a request is testing if the host recovered.
+        self.probing = False
+
+
+class RequestScheduler:
+    """
+    Sends requests with a limit of concurrent requests per host that adapts to
+    the responses (additive increase, multiplicative decrease): it increases
+    while responses are fast and successful, up to `max_concurrency`, and is
+    halved on each slow (more than `target_latency` seconds) or failed
+    response.
+
+    The latency of a request includes reading its content, except for
+    streamed requests (`stream=True`) without `consume` (see `request`), whose
+    latency is the time until the headers are received.
+
+    Requests that fail with a connection error, a timeout (of `timeout`
+    seconds) or a 5xx/429 status are retried up to `retries` times, waiting
+    an exponential and jittered time starting at `backoff` seconds.
+
+    After `failure_threshold` consecutive failures the host's circuit opens:
+    no requests are sent to it during `reset_timeout` seconds, after which a
+    single request tests whether the host recovered.
+    """
+    def __init__(self, max_concurrency=16, initial_concurrency=2, timeout=60,
+                 retries=5, backoff=1, max_backoff=60, target_latency=5,
+                 failure_threshold=10, reset_timeout=60):
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = initial_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.target_latency = target_latency
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _get_host(self, url):
+        name = urlsplit(url).netloc
+        with self._lock:
+            if name not in self._hosts:
+                self._hosts[name] = _Host(self.initial_concurrency)
+            return self._hosts[name]
+
+    def concurrency(self, url):
+        """
+        Returns the current limit of concurrent requests to the host of `url`.
+        """
+        return self._get_host(url).limit
+
+    def _acquire(self, host):
+        """
+        Waits until a request can be sent to the host. Returns whether the
+        request tests a host whose circuit was open.
+        """
+        with host.condition:
+            while True:
+                now = time.time()
+                if host.open_until is not None:
+                    if now < host.open_until or host.probing:
+                        host.condition.wait(
+                            max(host.open_until - now, 0) or 1)
+                        continue
+                    host.probing = True
+                    host.running += 1
+                    return True
+
+                if host.running < int(host.limit):
+                    host.running += 1
+                    return False
+                host.condition.wait()
+
+    def _release(self, host, is_probe, succeeded, latency):
+        with host.condition:
+            host.running -= 1
+            if is_probe:
+                host.probing = False
+
+            if succeeded:
+                host.failures = 0
+                host.open_until = None
+                if latency <= self.target_latency:
+                    host.limit = min(self.max_concurrency,
+                                     host.limit + 1 / host.limit)
+                else:
+                    host.limit = max(1, host.limit / 2)
+            else:
+                host.failures += 1
+                host.limit = max(1, host.limit / 2)
+                if is_probe or host.failures >= self.failure_threshold:
+                    host.open_until = time.time() + self.reset_timeout
+                    logger.warning('%d consecutive failed requests: stopped '
+                                   'requests for %.1fs.', host.failures,
+                                   self.reset_timeout)
+            host.condition.notify_all()
+
+    @staticmethod
+    def _is_failure(response):
+        return response.status_code >= 500 or response.status_code == 429
+
+    def _wait(self, attempt):
+        time.sleep(min(self.max_backoff, self.backoff * 2**attempt) *
+                   random.uniform(0.5, 1))
+
+    def request(self, session, url, headers=None, consume=None, **kwargs):
+        """
+        Returns the response of `session.get(url, headers=headers, **kwargs)`,
+        retrying it when it fails. Raises the error of the last attempt when
+        all failed.
+
+        If `consume` is given, it is called with a successful response (e.g. to
+        decode a streamed content) as part of the request, so errors while the
+        content is read are retried like errors of the request; its result is
+        returned instead of the response, which is closed.
+        """
+        host = self._get_host(url)
+
+        for attempt in range(self.retries + 1):
+            is_last = attempt == self.retries
+
+            is_probe = self._acquire(host)
+            start = time.time()
+            try:
+                response = session.get(url, headers=headers,
+                                       timeout=self.timeout, **kwargs)
+                result = response
+                if consume is not None:
+                    if not self._is_failure(response):
+                        try:
+                            result = consume(response)
+                        finally:
+                            response.close()
+                elif not kwargs.get('stream'):
+                    # the content is read here so it counts in the latency.
+                    response.content
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as error:
+                self._release(host, is_probe, False, time.time() - start)
+                logger.warning('request to %s failed (%s).', url, error)
+                if is_last:
+                    raise
+            except Exception:
+                self._release(host, is_probe, False, time.time() - start)
+                raise
+            else:
+                succeeded = not self._is_failure(response)
+                self._release(host, is_probe, succeeded, time.time() - start)
+                if succeeded:
+                    return result
+                logger.warning('request to %s failed with status %d.', url,
+                               response.status_code)
+                # releases the connection of a streamed response.
+                response.close()
+                if is_last:
+                    response.raise_for_status()
+                    return response
+
+            self._wait(attempt)
+
+
+# requests of all crawlers share the same limits.
+default_scheduler = RequestScheduler()
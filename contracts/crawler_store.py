@@ -0,0 +1,118 @@
+"""
+Stores responses of BASE so crawls can be replayed without hitting BASE.
+"""
+import gzip
+import hashlib
+import os
+import pickle
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from main.tools.files import atomic_write
+
+
+class ResponseNotStored(Exception):
+    """
+    When a store is offline and has no response for a request.
+    """
+    def __init__(self, url, headers=None):
+        self.url = url
+        self.headers = headers
+
+
+class FileResponseStore:
+    """
+    Stores responses in a directory, one gzipped file per request, identified
+    by its url and `Range` header.
+
+    A stored response is used while it is younger than `max_age` seconds
+    (forever if `max_age=None`); after that, it is re-fetched conditionally
+    (`If-None-Match`) and kept if BASE answers that it did not change.
+    If `offline` is true, BASE is never hit and requests without a stored
+    response raise `ResponseNotStored`.
+    """
+    def __init__(self, directory, max_age=None, offline=False):
+        self.directory = directory
+        self.max_age = max_age
+        self.offline = offline
+
+    @staticmethod
+    def key(url, headers=None):
+        headers = headers or {}
+        key = '%s|%s' % (url, headers.get('Range', ''))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.gz')
+
+    def load(self, url, headers=None):
+        """
+        Returns the stored record of the request or None.
+        """
+        try:
+            with gzip.open(self._path(self.key(url, headers)), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, url, headers, record):
+        path = self._path(self.key(url, headers))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with atomic_write(path) as f, gzip.open(f, 'wb') as gzip_file:
+            pickle.dump(record, gzip_file, pickle.HIGHEST_PROTOCOL)
+
+    def is_fresh(self, record):
+        return self.max_age is None or \
+            time.time() - record['stored_at'] < self.max_age
+
+    @staticmethod
+    def to_record(response):
+        return {'url': response.url,
+                'status_code': response.status_code,
+                'headers': dict(response.headers),
+                'encoding': response.encoding,
+                'content': response.content,
+                'stored_at': time.time()}
+
+    @staticmethod
+    def to_response(record):
+        response = requests.Response()
+        response.url = record['url']
+        response.status_code = record['status_code']
+        response.headers = CaseInsensitiveDict(record['headers'])
+        response.encoding = record['encoding']
+        response._content = record['content']
+        response._content_consumed = True
+        return response
+
+    def get_response(self, get, url, headers=None, **kwargs):
+        """
+        Returns the response of `get(url, headers=headers, **kwargs)` (e.g.
+        `get` of a `requests.Session`), from the store when possible.
+        """
+        record = self.load(url, headers)
+
+        if record is not None and (self.offline or self.is_fresh(record)):
+            return self.to_response(record)
+        if self.offline:
+            raise ResponseNotStored(url, headers)
+
+        request_headers = dict(headers or {})
+        if record is not None:
+            etag = CaseInsensitiveDict(record['headers']).get('ETag')
+            if etag is not None:
+                request_headers['If-None-Match'] = etag
+
+        response = get(url, headers=request_headers, **kwargs)
+
+        if response.status_code == 304 and record is not None:
+            record['stored_at'] = time.time()
+            self.save(url, headers, record)
+            return self.to_response(record)
+
+        if response.status_code in (200, 206):
+            self.save(url, headers, self.to_record(response))
+        return response
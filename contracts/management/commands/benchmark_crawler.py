@@ -0,0 +1,149 @@
+from collections import deque
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from contracts import models
+from contracts.crawler import ContractsCrawler, EntitiesCrawler, \
+    TendersCrawler, ContractsStaticDataCrawler
+from contracts.tools.fake_base import FakeBase, start_server, server_url
+
+
+# models crawled from BASE; the benchmark only runs when they are empty.
+CRAWLED_MODELS = (models.Entity, models.Contract, models.Tender)
+
+STATIC_MODELS = (models.ContractType, models.ProcedureType, models.ModelType,
+                 models.ActType, models.Council, models.District,
+                 models.Country)
+
+
+class Command(BaseCommand):
+    help = 'Measures the crawler against a local stand-in of BASE with ' \
+           'synthetic data. It only runs on a database without entities, ' \
+           'contracts and tenders, and the crawled data is deleted at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--contracts',
+            type=int,
+            default=10000,
+            help='Number of contracts in BASE (default: 10000).')
+
+        parser.add_argument(
+            '--entities',
+            type=int,
+            default=1000,
+            help='Number of entities in BASE (default: 1000).')
+
+        parser.add_argument(
+            '--tenders',
+            type=int,
+            default=1000,
+            help='Number of tenders in BASE (default: 1000).')
+
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0,
+            help='Seconds each response of BASE takes (default: 0).')
+
+        parser.add_argument(
+            '--items-per-batch',
+            type=int,
+            default=1000,
+            help='Number of items of each batch (default: 1000).')
+
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of concurrent requests to BASE (default: 1).')
+
+        parser.add_argument(
+            '--prefetch',
+            type=int,
+            default=0,
+            help='Number of lists of items prefetched (default: 0).')
+
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Saves the items of each batch in bulk.')
+
+    def _measure(self, crawler, options):
+        """
+        Synchronizes all items of `crawler` and returns the number of items
+        per second, queries per item and peak memory (in MB).
+        """
+        # queries are counted from the log of the connection, which is
+        # unbounded during the measurement (it is also counted as memory).
+        queries_log = connection.queries_log
+        connection.queries_log = deque()
+
+        tracemalloc.start()
+        start = time.time()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                aggregated = crawler.update(
+                    items_per_batch=options['items_per_batch'],
+                    workers=options['workers'], bulk=options['bulk'],
+                    prefetch=options['prefetch'])
+            duration = time.time() - start
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            connection.queries_log = queries_log
+
+        items = max(aggregated['added'] + aggregated['updated'], 1)
+        return items / duration, len(queries) / items, peak / 1024 / 1024
+
+    def _delete(self, static_models, checkpoints):
+        """
+        Deletes the synthetic data: the crawled items, the static data of
+        `static_models` and the checkpoints not in `checkpoints`.
+        """
+        for model in CRAWLED_MODELS:
+            model._default_manager.all().delete()
+        models.ContractsRollup.objects.all().delete()
+        models.CrawlerCheckpoint.objects.exclude(pk__in=checkpoints).delete()
+        for model in static_models:
+            model.objects.all().delete()
+
+    def handle(self, **options):
+        # synthetic items would overwrite or delete existing items with the
+        # same base_id.
+        if any(model._default_manager.exists() for model in CRAWLED_MODELS):
+            raise CommandError('The database has entities, contracts or '
+                               'tenders: use an empty database.')
+        empty_static_models = [model for model in STATIC_MODELS
+                               if not model.objects.exists()]
+        checkpoints = list(models.CrawlerCheckpoint.objects
+                           .values_list('pk', flat=True))
+
+        base = FakeBase(options['contracts'], options['entities'],
+                        options['tenders'], options['latency'])
+        server = start_server(base)
+        proxies = {'http': server_url(server)}
+
+        try:
+            static_crawler = ContractsStaticDataCrawler()
+            static_crawler.session.proxies = proxies
+            static_crawler.retrieve_and_save_all()
+
+            for crawler in (EntitiesCrawler(), ContractsCrawler(),
+                            TendersCrawler()):
+                crawler.session.proxies = proxies
+                items_per_second, queries_per_item, peak = \
+                    self._measure(crawler, options)
+                self.stdout.write(
+                    '%s: %.1f items/s, %.1f queries/item, '
+                    'peak memory %.1f MB' % (crawler.object_name,
+                                             items_per_second,
+                                             queries_per_item, peak))
+        finally:
+            server.shutdown()
+            server.server_close()
+            self._delete(empty_static_models, checkpoints)
@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
 
 from contracts.analysis import analysis_manager
-from contracts.models import Entity, Category
+from contracts.models import compute_categories_data, compute_entities_data, \
+    update_contracts_rollup
 
 
 class Command(BaseCommand):
@@ -23,20 +24,36 @@ class Command(BaseCommand):
             action='store_true',
             help='Recompute cache of categories.')
 
+        parser.add_argument(
+            '--rollup',
+            action='store_true',
+            help='Rebuild the rollup of contracts used by analysis.')
+
         parser.add_argument(
             '--analysis',
             action='store_true',
             help='Recompute cache of analysis.')
 
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of analysis recomputed in parallel (default: 1).')
+
     def handle(self, **options):
         if options['entities'] or options['all']:
-            for entity in Entity.objects.filter(data__is_updated=False):
-                entity.compute_data()
+            compute_entities_data()
 
         if options['categories'] or options['all']:
-            for category in Category.objects.all():
-                category.compute_data()
+            compute_categories_data()
+
+        if options['rollup'] or options['all']:
+            update_contracts_rollup()
 
         if options['analysis'] or options['all']:
-            for analysis in list(analysis_manager.values()):
-                analysis.update()
+            durations = analysis_manager.refresh_all(options['workers'])
+            for name, duration in sorted(durations.items()):
+                if duration is None:
+                    self.stdout.write('%s: failed' % name)
+                else:
+                    self.stdout.write('%s: %.2fs' % (name, duration))
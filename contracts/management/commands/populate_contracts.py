@@ -1,10 +1,14 @@
+import os
+import socket
+
 from django.core.management.base import BaseCommand
 
 from contracts.crawler import ContractsCrawler, EntitiesCrawler, TendersCrawler, \
     ContractsStaticDataCrawler
 from contracts.categories_crawler import build_categories
+from contracts.crawler_store import FileResponseStore
 
-from contracts.models import Category, ProcedureType
+from contracts.models import Category
 
 
 class Command(BaseCommand):
@@ -35,40 +39,119 @@ class Command(BaseCommand):
         parser.add_argument(
             '--static',
             action='store_true',
-            help='Populates db with static data. '
-                 'Typically only needs to run once with this option.')
+            help='Synchronizes static data (types, countries, districts and '
+                 'councils) with BASE.')
 
         parser.add_argument(
             '--bootstrap',
             action='store_true',
             help='Synchronizes the database from scratch. WARNING: may take days.')
 
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Resumes an interrupted synchronization from scratch '
+                 '(see --bootstrap) from its last completed batch. A finished '
+                 'one only synchronizes the items added since then.')
+
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of concurrent requests to BASE used to retrieve '
+                 'entities, contracts and tenders (default: 1).')
+
+        parser.add_argument(
+            '--prefetch',
+            type=int,
+            default=0,
+            help='Number of lists of items of the next batches retrieved from '
+                 'BASE while a batch is synchronized (default: 0).')
+
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Saves entities, contracts and tenders of each batch in bulk.')
+
+        parser.add_argument(
+            '--worker',
+            action='store_true',
+            help='Synchronizes all items as one of many workers: the rows of '
+                 'BASE are split in shards that are claimed by the workers '
+                 'running this command.')
+
+        parser.add_argument(
+            '--shard-size',
+            type=int,
+            default=10000,
+            help='Number of rows of each shard (see --worker, default: 10000).')
+
+        parser.add_argument(
+            '--reset-shards',
+            action='store_true',
+            help='Restarts the synchronization of --worker from scratch. Use '
+                 'it only when no worker is running.')
+
+        parser.add_argument(
+            '--store',
+            help='Directory where responses of BASE are stored and replayed '
+                 'from.')
+
+        parser.add_argument(
+            '--max-age',
+            type=int,
+            default=None,
+            help='Seconds during which a stored response is used without '
+                 'asking BASE whether it changed (default: forever).')
+
+        parser.add_argument(
+            '--offline',
+            action='store_true',
+            help='Only uses stored responses (see --store).')
+
+        parser.add_argument(
+            '--entities-data',
+            action='store_true',
+            help='Computes the data of the entities of the contracts after '
+                 'each batch of contracts.')
+
     def handle(self, **options):
+        store = None
+        if options['store']:
+            store = FileResponseStore(options['store'], options['max_age'],
+                                      options['offline'])
+
         if options['static']:
-            if options['bootstrap'] or not ProcedureType.objects.exists():
-                ContractsStaticDataCrawler().retrieve_and_save_all()
+            ContractsStaticDataCrawler(store).retrieve_and_save_all()
 
         if options['categories']:
             if options['bootstrap'] or not Category.objects.exists():
                 build_categories()
 
         if options['entities']:
-            crawler = EntitiesCrawler()
-            if options['bootstrap']:
-                crawler.update(0)
-            else:
-                crawler.update(-2000)
+            self._update(EntitiesCrawler(store), options)
 
         if options['contracts']:
-            crawler = ContractsCrawler()
-            if options['bootstrap']:
-                crawler.update(0)
-            else:
-                crawler.update(-2000)
+            crawler = ContractsCrawler(store)
+            crawler.update_entities_data = options['entities_data']
+            self._update(crawler, options)
 
         if options['tenders']:
-            crawler = TendersCrawler()
-            if options['bootstrap']:
-                crawler.update(0)
-            else:
-                crawler.update(-2000)
+            self._update(TendersCrawler(store), options)
+
+    @staticmethod
+    def _update(crawler, options):
+        if options['worker']:
+            crawler.create_shards(options['shard_size'],
+                                  reset=options['reset_shards'])
+            worker = '%s-%d' % (socket.gethostname(), os.getpid())
+            crawler.work(worker, workers=options['workers'],
+                         bulk=options['bulk'], prefetch=options['prefetch'])
+            return
+
+        if options['bootstrap'] or options['resume']:
+            start = 0
+        else:
+            start = -2000
+        crawler.update(start, workers=options['workers'], bulk=options['bulk'],
+                       resume=options['resume'], prefetch=options['prefetch'])
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0005_category_code_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlerCheckpoint',
+            fields=[
+                ('id', models.AutoField(primary_key=True, auto_created=True, verbose_name='ID', serialize=False)),
+                ('object_name', models.CharField(max_length=254)),
+                ('start', models.IntegerField()),
+                ('end', models.IntegerField()),
+                ('position', models.IntegerField()),
+                ('added', models.IntegerField(default=0)),
+                ('updated', models.IntegerField(default=0)),
+                ('deleted', models.IntegerField(default=0)),
+                ('is_finished', models.BooleanField(default=False)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='crawlercheckpoint',
+            unique_together=set([('object_name', 'start')]),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0006_crawlercheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContractsRollup',
+            fields=[
+                ('id', models.AutoField(primary_key=True, auto_created=True, verbose_name='ID', serialize=False)),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('count', models.IntegerField()),
+                ('price', models.BigIntegerField()),
+                ('deltat', models.BigIntegerField()),
+                ('depth', models.IntegerField()),
+                ('good_text', models.IntegerField()),
+                ('category', models.ForeignKey(to='contracts.Category', null=True)),
+                ('entity', models.ForeignKey(to='contracts.Entity', null=True)),
+                ('procedure_type', models.ForeignKey(to='contracts.ProcedureType', null=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='contractsrollup',
+            index_together=set([('year', 'month')]),
+        ),
+    ]
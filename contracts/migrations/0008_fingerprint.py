@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0007_contractsrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contract',
+            name='fingerprint',
+            field=models.CharField(max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='entity',
+            name='fingerprint',
+            field=models.CharField(max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='tender',
+            name='fingerprint',
+            field=models.CharField(max_length=40, null=True),
+        ),
+
+        # the crawler compares ranges of (base_id, fingerprint)
+        migrations.RunSQL(
+            'CREATE INDEX contracts_contract_fingerprint_seq '
+            'ON contracts_contract (base_id, fingerprint)',
+            reverse_sql='DROP INDEX contracts_contract_fingerprint_seq'),
+        migrations.RunSQL(
+            'CREATE INDEX contracts_entity_fingerprint_seq '
+            'ON contracts_entity (base_id, fingerprint)',
+            reverse_sql='DROP INDEX contracts_entity_fingerprint_seq'),
+        migrations.RunSQL(
+            'CREATE INDEX contracts_tender_fingerprint_seq '
+            'ON contracts_tender (base_id, fingerprint)',
+            reverse_sql='DROP INDEX contracts_tender_fingerprint_seq'),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contracts', '0008_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlerShard',
+            fields=[
+                ('id', models.AutoField(primary_key=True, auto_created=True, verbose_name='ID', serialize=False)),
+                ('object_name', models.CharField(max_length=254)),
+                ('start', models.IntegerField()),
+                ('end', models.IntegerField()),
+                ('status', models.CharField(max_length=20, choices=[('pending', 'pending'), ('running', 'running'), ('finished', 'finished'), ('failed', 'failed')], default='pending')),
+                ('worker', models.CharField(max_length=254, null=True)),
+                ('lease_expires', models.DateTimeField(null=True)),
+                ('heartbeat', models.DateTimeField(null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('added', models.IntegerField(default=0)),
+                ('updated', models.IntegerField(default=0)),
+                ('deleted', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='crawlershard',
+            unique_together=set([('object_name', 'start')]),
+        ),
+    ]
@@ -3,7 +3,7 @@ import datetime
 
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import connection, models, transaction
 from django.db.models import Sum, Count, Max
 from django.db.models.signals import m2m_changed, pre_delete
 from django.utils.text import slugify
@@ -27,6 +27,10 @@ class District(models.Model):
     country = models.ForeignKey('Country')
 
 
+def _contracts_aggregates_cache_name(code):
+    return __name__ + '>_contracts_aggregates' + '>%s' % code
+
+
 class Category(NS_Node):
     code = models.CharField(max_length=254, unique=True, db_index=True)
     description_en = models.CharField(max_length=254)
@@ -42,7 +46,7 @@ class Category(NS_Node):
 
         If `flush_cache` is true, the aggregate is re-computed and re-cached.
         """
-        cache_name = __name__ + '>_contracts_aggregates' + '>%s' % self.code
+        cache_name = _contracts_aggregates_cache_name(self.code)
         aggregate = cache.get(cache_name)
 
         if aggregate is None or flush_cache:
@@ -79,6 +83,10 @@ class Council(models.Model):
     district = models.ForeignKey('District')
 
 
+def _contracts_ids_cache_name(entity_id):
+    return __name__ + '>contracts_ids' + '>%s' % entity_id
+
+
 class Entity(models.Model):
 
     name = models.CharField(max_length=254)
@@ -87,6 +95,10 @@ class Entity(models.Model):
 
     nif = models.CharField(max_length=254)
 
+    # hash of the entry in BASE's list, used to identify changes
+    # (see `DynamicCrawler.get_base_ids`)
+    fingerprint = models.CharField(max_length=40, null=True)
+
     country = models.ForeignKey('Country', null=True)
 
     def total_earned(self):
@@ -110,7 +122,7 @@ class Entity(models.Model):
         Returns a dictionary with keys 'made' and 'set' with the list of
         ids of contracts_made and contract_set respectively.
         """
-        cache_name = __name__ + '>contracts_ids' + '>%s' % self.id
+        cache_name = _contracts_ids_cache_name(self.id)
         result = cache.get(cache_name)
         if result is None or flush_cache:
             # retrieves the lists.
@@ -256,6 +268,10 @@ class Contract(models.Model):
     contractors = models.ManyToManyField('Entity', related_name='contracts_made')
     contracted = models.ManyToManyField('Entity')
 
+    # hash of the entry in BASE's list, used to identify changes
+    # (see `DynamicCrawler.get_base_ids`)
+    fingerprint = models.CharField(max_length=40, null=True)
+
     objects = ContractManager()
     default_objects = models.Manager()
 
@@ -300,6 +316,10 @@ class Tender(models.Model):
 
     dre_url = models.TextField()
 
+    # hash of the entry in BASE's list, used to identify changes
+    # (see `DynamicCrawler.get_base_ids`)
+    fingerprint = models.CharField(max_length=40, null=True)
+
     def get_dre_url(self):
         return self.dre_url
 
@@ -311,20 +331,311 @@ class Tender(models.Model):
         ordering = ['-publication_date']
 
 
+class ContractsRollup(models.Model):
+    """
+    Number and sums of contracts signed in a month, by procedure type, category
+    and contractor, maintained by the crawler (see `update_contracts_rollup`)
+    so analysis don't need to scan all contracts.
+
+    Rows with `entity=None` aggregate all contracts, each contract once; the
+    remaining rows aggregate the contracts of each contractor.
+    """
+    entity = models.ForeignKey('Entity', null=True)
+    procedure_type = models.ForeignKey('ProcedureType', null=True)
+    category = models.ForeignKey('Category', null=True)
+    year = models.IntegerField()
+    month = models.IntegerField()
+
+    count = models.IntegerField()
+    price = models.BigIntegerField()
+
+    # sums used to compute averages over the contracts:
+    # days between signing and publication,
+    deltat = models.BigIntegerField()
+    # depth of the category,
+    depth = models.IntegerField()
+    # and number of contracts with a description different from its title.
+    good_text = models.IntegerField()
+
+    class Meta:
+        index_together = [('year', 'month')]
+
+
+class CrawlerCheckpoint(models.Model):
+    """
+    The progress of the last synchronization of a type of object (e.g.
+    contracts) with BASE from a given start (e.g. 0 or -2000), stored after
+    each batch so an interrupted synchronization can be resumed.
+    """
+    object_name = models.CharField(max_length=254)
+
+    # the `start` argument of the synchronization...
+    start = models.IntegerField()
+    # ...its last row...
+    end = models.IntegerField()
+    # ...and the row until which it was completed.
+    position = models.IntegerField()
+
+    added = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    deleted = models.IntegerField(default=0)
+
+    is_finished = models.BooleanField(default=False)
+
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('object_name', 'start')
+
+
+def invalidate_entities_data(entities_ids):
+    """
+    Marks the data of the entities with ids `entities_ids` as not updated,
+    creating it when it doesn't exist, using one query per operation.
+    """
+    entities_ids = set(entities_ids)
+
+    existing = set(EntityData.objects.filter(entity_id__in=entities_ids)
+                   .values_list('entity_id', flat=True))
+
+    EntityData.objects.filter(entity_id__in=existing).update(is_updated=False)
+    EntityData.objects.bulk_create([EntityData(entity_id=entity_id)
+                                    for entity_id in entities_ids - existing])
+
+
+def update_contracts_rollup(months=None):
+    """
+    Re-computes the rows of `ContractsRollup` of `months`, an iterable of
+    tuples `(year, month)`, or of all months if `months` is None.
+    """
+    if months is None:
+        delete_condition = 'TRUE'
+        condition = 'contracts_contract.signing_date IS NOT NULL'
+        params = []
+    else:
+        months = sorted(set(months))
+        if not months:
+            return
+        delete_condition = ' OR '.join(['(year = %s AND month = %s)']*len(months))
+        condition = ' OR '.join(['(contracts_contract.signing_date >= %s AND '
+                                 'contracts_contract.signing_date < %s)'] *
+                                len(months))
+        params = []
+        for year, month in months:
+            params.append(datetime.date(year, month, 1))
+            params.append(datetime.date(year + month // 12, month % 12 + 1, 1))
+
+    columns = """
+contracts_contract.procedure_type_id,
+contracts_contract.category_id,
+CAST(EXTRACT(YEAR FROM contracts_contract.signing_date) AS INTEGER)  AS s_year,
+CAST(EXTRACT(MONTH FROM contracts_contract.signing_date) AS INTEGER) AS s_month,
+contracts_contract.price,
+ABS(contracts_contract.added_date - contracts_contract.signing_date) AS deltat,
+COALESCE(contracts_category.depth, 0)                                AS depth,
+CASE WHEN
+  contracts_contract.description = contracts_contract.contract_description OR
+  contracts_contract.description IS NULL OR
+  contracts_contract.contract_description IS NULL
+  THEN 0
+  ELSE 1 END                                                         AS good_text
+    """
+
+    query = """
+INSERT INTO contracts_contractsrollup
+  (entity_id, procedure_type_id, category_id, year, month,
+   count, price, deltat, depth, good_text)
+SELECT contracts.entity_id, contracts.procedure_type_id,
+       contracts.category_id, contracts.s_year, contracts.s_month,
+       COUNT(*), SUM(contracts.price), SUM(contracts.deltat),
+       SUM(contracts.depth), SUM(contracts.good_text)
+FROM (
+  SELECT CAST(NULL AS INTEGER) AS entity_id, %(columns)s
+  FROM contracts_contract
+    LEFT OUTER JOIN contracts_category
+      ON (contracts_contract.category_id = contracts_category.id)
+  WHERE %(condition)s
+  UNION ALL
+  SELECT contracts_contract_contractors.entity_id, %(columns)s
+  FROM contracts_contract
+    INNER JOIN contracts_contract_contractors
+      ON (contracts_contract.id = contracts_contract_contractors.contract_id)
+    LEFT OUTER JOIN contracts_category
+      ON (contracts_contract.category_id = contracts_category.id)
+  WHERE %(condition)s
+) AS contracts
+GROUP BY contracts.entity_id, contracts.procedure_type_id,
+         contracts.category_id, contracts.s_year, contracts.s_month
+    """ % {'columns': columns, 'condition': condition}
+
+    logger.info('updating contracts rollup of %s months',
+                'all' if months is None else len(months))
+
+    delete_params = []
+    if months is not None:
+        for year, month in months:
+            delete_params += [year, month]
+
+    with transaction.atomic():
+        cursor = connection.cursor()
+        # concurrent updates (e.g. of several crawler workers) of the same
+        # months would each insert their rows after the other's delete, so
+        # updates are serialized. Readers are not blocked.
+        cursor.execute('LOCK TABLE contracts_contractsrollup IN EXCLUSIVE MODE')
+        cursor.execute('DELETE FROM contracts_contractsrollup WHERE %s' %
+                       delete_condition, delete_params)
+        cursor.execute(query, params + params)
+
+
+def compute_categories_data():
+    """
+    Computes and caches the aggregates of contracts of all categories, as
+    `Category.compute_data` does for one category, using one grouped query:
+    the aggregates of each category are added to the ones of its ancestors in
+    memory using the nested set bounds of the tree.
+
+    Returns a dictionary `code -> aggregate`.
+    """
+    totals = {}
+    for row in Contract.default_objects.exclude(category=None)\
+            .values('category').annotate(count=Count('id'), price=Sum('price'))\
+            .order_by():
+        totals[row['category']] = (row['count'], row['price'])
+
+    aggregates = {}
+    # the current category and its ancestors, as
+    # [tree_id, rgt, code, count, price]
+    stack = []
+
+    def pop():
+        tree_id, rgt, code, count, price = stack.pop()
+        # as in `Category._contracts_aggregates`, the price is None when
+        # there are no contracts.
+        aggregates[code] = {'count': count, 'price': price if count else None}
+        if stack:
+            stack[-1][3] += count
+            stack[-1][4] += price
+
+    for category_id, code, tree_id, lft, rgt in Category.objects\
+            .order_by('tree_id', 'lft')\
+            .values_list('id', 'code', 'tree_id', 'lft', 'rgt'):
+        # leave the categories that are not ancestors of this one
+        while stack and (stack[-1][0] != tree_id or stack[-1][1] < lft):
+            pop()
+        count, price = totals.get(category_id, (0, 0))
+        stack.append([tree_id, rgt, code, count, price])
+    while stack:
+        pop()
+
+    cache.set_many(dict((_contracts_aggregates_cache_name(code), aggregate)
+                        for code, aggregate in aggregates.items()), 60*60*24)
+
+    return aggregates
+
+
+def compute_entities_data():
+    """
+    Computes the data of all entities whose data is not updated, as
+    `Entity.compute_data` does for one entity, using a constant number of
+    queries.
+
+    Returns the number of entities whose data was computed.
+    """
+    entities_ids = list(EntityData.objects.filter(is_updated=False)
+                        .values_list('entity_id', flat=True))
+    if not entities_ids:
+        return 0
+
+    logger.info('computing data of %d entities', len(entities_ids))
+
+    query = """
+UPDATE contracts_entitydata
+SET total_earned = COALESCE(earned.price, 0),
+    total_expended = COALESCE(expended.price, 0),
+    last_activity = GREATEST(earned.last_activity, expended.last_activity),
+    is_updated = TRUE
+FROM contracts_entitydata AS data
+  LEFT OUTER JOIN (
+    SELECT contracts_contract_contracted.entity_id,
+           SUM(contracts_contract.price)          AS price,
+           MAX(contracts_contract.signing_date)   AS last_activity
+    FROM contracts_contract_contracted
+      INNER JOIN contracts_contract
+        ON (contracts_contract_contracted.contract_id = contracts_contract.id)
+    WHERE contracts_contract_contracted.entity_id = ANY(%s)
+    GROUP BY contracts_contract_contracted.entity_id
+  ) AS earned ON (data.entity_id = earned.entity_id)
+  LEFT OUTER JOIN (
+    SELECT contracts_contract_contractors.entity_id,
+           SUM(contracts_contract.price)          AS price,
+           MAX(contracts_contract.signing_date)   AS last_activity
+    FROM contracts_contract_contractors
+      INNER JOIN contracts_contract
+        ON (contracts_contract_contractors.contract_id = contracts_contract.id)
+    WHERE contracts_contract_contractors.entity_id = ANY(%s)
+    GROUP BY contracts_contract_contractors.entity_id
+  ) AS expended ON (data.entity_id = expended.entity_id)
+WHERE contracts_entitydata.id = data.id AND data.entity_id = ANY(%s)
+    """
+
+    with transaction.atomic():
+        cursor = connection.cursor()
+        cursor.execute(query, (entities_ids, entities_ids, entities_ids))
+
+    # the lists of contracts are re-computed when requested.
+    cache.delete_many([_contracts_ids_cache_name(entity_id)
+                       for entity_id in entities_ids])
+
+    return len(entities_ids)
+
+
 def invalidate_entity_data(sender, instance, **kwargs):
     if sender in [Contract.contractors.through,
                   Contract.contracted.through, Contract]:
-        for entity in list(instance.contractors.all()) + \
-                list(instance.contracted.all()):
-            try:
-                entity.data
-            except EntityData.DoesNotExist:
-                entity.data = EntityData(entity=entity)
-            entity.data.is_updated = False
-            entity.data.save()
+        invalidate_entities_data(
+            list(instance.contractors.values_list('id', flat=True)) +
+            list(instance.contracted.values_list('id', flat=True)))
 
 
 pre_delete.connect(invalidate_entity_data, sender=Contract)
 
 m2m_changed.connect(invalidate_entity_data, sender=Contract.contractors.through)
 m2m_changed.connect(invalidate_entity_data, sender=Contract.contracted.through)
+
+
+class CrawlerShard(models.Model):
+    """
+    A range of rows of BASE of a type of object (e.g. contracts) to be
+    synchronized by one of many workers. A worker holds a lease on the shard
+    while synchronizing it, and renews it after each batch; shards whose lease
+    expired are claimed again by other workers.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    STATUSES = ((PENDING, 'pending'), (RUNNING, 'running'),
+                (FINISHED, 'finished'), (FAILED, 'failed'))
+
+    object_name = models.CharField(max_length=254)
+
+    # rows [start, end) of BASE
+    start = models.IntegerField()
+    end = models.IntegerField()
+
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING)
+
+    # the worker holding the lease and when it expires
+    worker = models.CharField(max_length=254, null=True)
+    lease_expires = models.DateTimeField(null=True)
+    heartbeat = models.DateTimeField(null=True)
+
+    # number of times the shard was claimed
+    attempts = models.IntegerField(default=0)
+
+    added = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    deleted = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('object_name', 'start')
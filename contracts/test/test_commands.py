@@ -3,7 +3,9 @@ from datetime import datetime
 from django.core.management import call_command
 from django.test import TestCase
 
-from contracts.models import Entity, Contract, Category
+from contracts.models import Entity, Contract, Category, EntityData, \
+    compute_entities_data, compute_categories_data, ContractsRollup, \
+    update_contracts_rollup
 
 
 class CommandsTestCase(TestCase):
@@ -36,3 +38,105 @@ class CommandsTestCase(TestCase):
         call_command('cache_contracts', all=True)
 
         self.assertTrue(e1.data.is_updated)
+
+    def test_compute_entities_data(self):
+        e1 = Entity.objects.create(nif='nif', base_id=1, name='e1')
+        e2 = Entity.objects.create(nif='nif', base_id=2, name='e2')
+        e3 = Entity.objects.create(nif='nif', base_id=3, name='e3')
+
+        c1 = Contract.objects.create(base_id=1, contract_description='da',
+                                     price=200,
+                                     added_date=datetime(2003, 1, 1),
+                                     signing_date=datetime(2003, 1, 1))
+        c2 = Contract.objects.create(base_id=2, contract_description='da',
+                                     price=100,
+                                     added_date=datetime(2003, 1, 1),
+                                     signing_date=datetime(2004, 1, 1))
+        c1.contractors.add(e1)
+        c1.contracted.add(e2)
+        c2.contractors.add(e1)
+        c2.contracted.add(e1, e3)
+
+        self.assertEqual(3, compute_entities_data())
+        self.assertEqual(0, compute_entities_data())
+
+        data = EntityData.objects.get(entity=e1)
+        self.assertTrue(data.is_updated)
+        self.assertEqual(300, data.total_expended)
+        self.assertEqual(100, data.total_earned)
+        self.assertEqual(datetime(2004, 1, 1).date(), data.last_activity)
+
+        data = EntityData.objects.get(entity=e2)
+        self.assertEqual(0, data.total_expended)
+        self.assertEqual(200, data.total_earned)
+        self.assertEqual(datetime(2003, 1, 1).date(), data.last_activity)
+
+        # matches the computation of a single entity
+        e3.compute_data()
+        data = EntityData.objects.get(entity=e3)
+        self.assertEqual((100, 0), (data.total_earned, data.total_expended))
+
+    def test_compute_categories_data(self):
+        root = Category.add_root(code='45000000-7')
+        child = root.add_child(code='45200000-9')
+        grandchild = child.add_child(code='45233141-9')
+        sibling = root.add_child(code='45300000-0')
+        other_root = Category.add_root(code='03000000-1')
+
+        for base_id, price, category in ((1, 100, grandchild), (2, 200, child),
+                                         (3, 400, sibling), (4, 800, None)):
+            Contract.objects.create(base_id=base_id, contract_description='da',
+                                    price=price, category=category,
+                                    added_date=datetime(2003, 1, 1))
+
+        aggregates = compute_categories_data()
+
+        self.assertEqual({'count': 3, 'price': 700}, aggregates[root.code])
+        self.assertEqual({'count': 2, 'price': 300}, aggregates[child.code])
+        self.assertEqual({'count': 1, 'price': 100}, aggregates[grandchild.code])
+        self.assertEqual({'count': 1, 'price': 400}, aggregates[sibling.code])
+        self.assertEqual({'count': 0, 'price': None}, aggregates[other_root.code])
+
+        # equal to the aggregates computed for each category
+        for category in Category.objects.all():
+            self.assertEqual(category._contracts_aggregates(flush_cache=True),
+                             aggregates[category.code])
+
+    def test_update_contracts_rollup(self):
+        e1 = Entity.objects.create(nif='nif', base_id=1, name='e1')
+        e2 = Entity.objects.create(nif='nif', base_id=2, name='e2')
+
+        c1 = Contract.objects.create(base_id=1, contract_description='da',
+                                     price=200,
+                                     added_date=datetime(2011, 1, 3),
+                                     signing_date=datetime(2011, 1, 1))
+        c2 = Contract.objects.create(base_id=2, contract_description='da',
+                                     price=100, description='bla',
+                                     added_date=datetime(2011, 1, 1),
+                                     signing_date=datetime(2011, 1, 1))
+        c1.contractors.add(e1, e2)
+        c2.contractors.add(e1)
+
+        update_contracts_rollup()
+
+        total = ContractsRollup.objects.get(entity=None)
+        self.assertEqual((2011, 1, 2, 300, 2, 0, 1),
+                         (total.year, total.month, total.count, total.price,
+                          total.deltat, total.depth, total.good_text))
+        self.assertEqual(2, ContractsRollup.objects.get(entity=e1).count)
+        self.assertEqual(200, ContractsRollup.objects.get(entity=e2).price)
+
+        # moving a contract to another month updates both months
+        c2.signing_date = datetime(2011, 12, 1)
+        c2.save()
+        update_contracts_rollup([(2011, 1), (2011, 12)])
+
+        self.assertEqual(1, ContractsRollup.objects.get(entity=None,
+                                                        month=1).count)
+        self.assertEqual(100, ContractsRollup.objects.get(entity=None,
+                                                          month=12).price)
+        self.assertEqual(5, ContractsRollup.objects.count())
+
+        # other months are not touched
+        update_contracts_rollup([(2012, 1)])
+        self.assertEqual(5, ContractsRollup.objects.count())
@@ -1,13 +1,17 @@
 from unittest import skipUnless
+import datetime
+import json
 import xml.etree.ElementTree
 
 from django.test import TestCase
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 from contracts.crawler import ContractsCrawler, EntitiesCrawler, TendersCrawler, \
-    DynamicCrawler, JSONLoadError, ContractsStaticDataCrawler
+    DynamicCrawler, JSONLoadError, ContractsStaticDataCrawler, iter_json_list
 from contracts import categories_crawler
 from contracts import models
+from contracts.tools.fake_base import FakeBase, start_server, server_url
 
 from contracts.test import HAS_REMOTE_ACCESS
 
@@ -52,10 +56,322 @@ class ImportCategoriesTestCase(TestCase):
 
         self.assertEqual(None, category.get_parent())
 
+    @staticmethod
+    def _xml(codes):
+        text = '<CPV_CODE>%s</CPV_CODE>' % ''.join(
+            '<CPV CODE="%s"><TEXT LANG="EN">en</TEXT><TEXT LANG="PT">pt</TEXT>'
+            '</CPV>' % code for code in codes)
+        return xml.etree.ElementTree.fromstring(text)
+
+    def test_build_categories(self):
+        categories_crawler.build_categories(self._xml([
+            '03000000-1', '03100000-2', '03110000-5', '03111000-2',
+            '03200000-3', '09000000-3']))
+
+        get = models.Category.objects.get
+        self.assertEqual(2, len(models.Category.get_root_nodes()))
+        self.assertEqual(get(code='03110000-5'),
+                         get(code='03111000-2').get_parent())
+        self.assertEqual(get(code='03000000-1'),
+                         get(code='03200000-3').get_parent())
+        self.assertEqual(4, get(code='03000000-1').get_descendant_count())
+        self.assertEqual(['03100000-2', '03200000-3'],
+                         [c.code for c in get(code='03000000-1').get_children()])
+
+        # only new codes are added
+        categories_crawler.build_categories(self._xml([
+            '03000000-1', '03210000-6', '09000000-3']))
+        self.assertEqual(7, models.Category.objects.count())
+        self.assertEqual(get(code='03200000-3'),
+                         get(code='03210000-6').get_parent())
+        self.assertEqual(5, get(code='03000000-1').get_descendant_count())
+
     def test_xml(self):
         self.assertEqual(9454, len(categories_crawler.get_xml()))
 
 
+class SaveInstancesTestCase(TestCase):
+
+    def setUp(self):
+        self.e1 = models.Entity.objects.create(name='e1', base_id=1, nif='nif')
+        self.e2 = models.Entity.objects.create(name='e2', base_id=2, nif='nif')
+        self.e3 = models.Entity.objects.create(name='e3', base_id=3, nif='nif')
+
+    @staticmethod
+    def _cleaned_data(base_id, price, contractors, contracted):
+        return {'base_id': base_id, 'price': price,
+                'contract_description': 'da', 'description': None,
+                'added_date': datetime.date(2010, 1, 1),
+                'signing_date': datetime.date(2010, 1, 1),
+                'cpvs': None, 'category': None, 'procedure_type': None,
+                'contract_type': None, 'country': None, 'district': None,
+                'council': None,
+                'contractors': contractors, 'contracted': contracted}
+
+    def test_contracts(self):
+        crawler = ContractsCrawler()
+
+        results = crawler.save_instances([
+            self._cleaned_data(1, 100, [self.e1], [self.e2]),
+            self._cleaned_data(2, 200, [self.e1], [self.e2, self.e3])])
+
+        self.assertEqual([True, True], [created for _, created in results])
+        self.assertEqual([1, 2], [c.base_id for c, _ in results])
+        self.assertEqual([self.e2, self.e3],
+                         list(results[1][0].contracted.order_by('base_id')))
+        for entity in (self.e1, self.e2, self.e3):
+            self.assertFalse(models.EntityData.objects.get(entity=entity)
+                             .is_updated)
+
+        self.e1.compute_data()
+        self.e2.compute_data()
+
+        # update one contract and change its relations
+        results = crawler.save_instances([
+            self._cleaned_data(2, 300, [self.e2], [self.e3])])
+
+        self.assertFalse(results[0][1])
+        contract = models.Contract.objects.get(base_id=2)
+        self.assertEqual(300, contract.price)
+        self.assertEqual([self.e2], list(contract.contractors.all()))
+        self.assertEqual([self.e3], list(contract.contracted.all()))
+        self.assertEqual(2, models.Contract.objects.count())
+
+        # e1 was and e2 is a contractor of the updated contract
+        self.assertFalse(models.EntityData.objects.get(entity=self.e1)
+                         .is_updated)
+        self.assertFalse(models.EntityData.objects.get(entity=self.e2)
+                         .is_updated)
+
+    def test_fingerprint(self):
+        item = {'id': 1, 'contracting': [{'id': 2}], 'price': '1,00 €'}
+
+        fingerprint = DynamicCrawler._fingerprint(item)
+        self.assertEqual(40, len(fingerprint))
+        # independent of the order of the keys
+        self.assertEqual(fingerprint, DynamicCrawler._fingerprint(
+            {'price': '1,00 €', 'contracting': [{'id': 2}], 'id': 1}))
+
+        item['contracting'] = [{'id': 3}]
+        self.assertNotEqual(fingerprint, DynamicCrawler._fingerprint(item))
+
+        crawler = ContractsCrawler()
+        crawler.save_instances([dict(self._cleaned_data(1, 100, [], []),
+                                     fingerprint=fingerprint)])
+        self.assertEqual(fingerprint,
+                         models.Contract.objects.get(base_id=1).fingerprint)
+
+
+class IterJSONListTestCase(TestCase):
+
+    def test_chunks(self):
+        data = [{'id': i, 'description': 'Câmara €', 'price': [i, 2.5]}
+                for i in range(20)] + [12345]
+        content = json.dumps(data, ensure_ascii=False, indent=1).encode()
+
+        for size in (1, 3, 100, len(content)):
+            chunks = [content[i:i + size] for i in range(0, len(content), size)]
+            self.assertEqual(data, list(iter_json_list(chunks)))
+
+        self.assertEqual([], list(iter_json_list([b' [ ] '])))
+
+    def test_invalid(self):
+        for content in (b'{"id": 0}', b'[1, 2', b'[1 2]', b''):
+            self.assertRaises(ValueError, list, iter_json_list([content]))
+
+
+class StaticDataSyncTestCase(TestCase):
+
+    def test_sync(self):
+        crawler = ContractsStaticDataCrawler()
+        elements = [{'id': '0', 'description': 'Todos'},
+                    {'id': '1', 'description': 'Ajuste directo'},
+                    {'id': '2', 'description': 'Concurso'}]
+
+        self.assertEqual(2, crawler._sync(elements, models.ContractType))
+        self.assertEqual(0, crawler._sync(elements, models.ContractType))
+
+        elements[2]['description'] = 'Concurso público'
+        elements.append({'id': '3', 'description': 'Outros'})
+        self.assertEqual(1, crawler._sync(elements, models.ContractType))
+        self.assertEqual(['Ajuste directo', 'Concurso público', 'Outros'],
+                         list(models.ContractType.objects.order_by('base_id')
+                              .values_list('name', flat=True)))
+
+    def test_sync_by_name(self):
+        crawler = ContractsStaticDataCrawler()
+        pt = models.Country.objects.create(name='Portugal')
+
+        crawler._sync([{'id': '0', 'description': 'Portugal'},
+                       {'id': '1', 'description': 'Espanha'}],
+                      models.Country, key='name', skip_all=False)
+        self.assertEqual(2, models.Country.objects.count())
+
+        district = models.District.objects.create(name='Faro', base_id=1,
+                                                  country=pt)
+        crawler._sync([{'id': '1', 'description': 'Loulé'}], models.Council,
+                      district=district)
+        self.assertEqual(district, models.Council.objects.get(base_id=1)
+                         .district)
+
+
+class ShardsTestCase(TestCase):
+
+    def setUp(self):
+        self.crawler = EntitiesCrawler()
+        for start in (0, 10):
+            models.CrawlerShard.objects.create(object_name='entity',
+                                               start=start, end=start + 10)
+
+    def test_claim(self):
+        shard1 = self.crawler.claim_shard('w1')
+        shard2 = self.crawler.claim_shard('w2')
+
+        self.assertEqual((0, 'w1', 1), (shard1.start, shard1.worker,
+                                        shard1.attempts))
+        self.assertEqual((10, 'w2'), (shard2.start, shard2.worker))
+        self.assertEqual(None, self.crawler.claim_shard('w3'))
+
+    def test_expired_lease(self):
+        shard = self.crawler.claim_shard('w1')
+        self.crawler.claim_shard('w2')
+
+        models.CrawlerShard.objects.filter(pk=shard.pk).update(
+            lease_expires=timezone.now() - datetime.timedelta(seconds=1))
+
+        shard3 = self.crawler.claim_shard('w3')
+        self.assertEqual((0, 'w3', 2), (shard3.start, shard3.worker,
+                                        shard3.attempts))
+
+        # w1 lost the lease
+        self.assertFalse(self.crawler._renew_shard(shard, heartbeat=None))
+        self.assertTrue(self.crawler._renew_shard(shard3, heartbeat=None))
+
+    def test_max_attempts(self):
+        models.CrawlerShard.objects.update(
+            status=models.CrawlerShard.RUNNING,
+            attempts=self.crawler.max_shard_attempts,
+            lease_expires=timezone.now() - datetime.timedelta(seconds=1))
+
+        self.assertEqual(None, self.crawler.claim_shard('w1'))
+        self.assertEqual(2, models.CrawlerShard.objects.filter(
+            status=models.CrawlerShard.FAILED).count())
+
+
+class FakeBaseCrawlerTestCase(TestCase):
+    """
+    Tests of concurrent and bulk synchronizations, against a fake BASE.
+    """
+    def setUp(self):
+        self.server = start_server(FakeBase(contracts=10, entities=21,
+                                            tenders=0))
+        models.Country.objects.create(name='Portugal')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _crawler(self, crawler_class):
+        crawler = crawler_class()
+        crawler.session.proxies = {'http': server_url(self.server)}
+        return crawler
+
+    def test_prepare_data(self):
+        c = self._crawler(ContractsCrawler)
+        data = c.get_json(c.object_url % 1)
+        ids = set(item['id'] for item in data['contracting'] + data['contracted'])
+
+        # the entities of the contract are retrieved before it is cleaned
+        c._prepare_data([data], workers=2)
+        self.assertEqual(ids, set(models.Entity.objects
+                                  .values_list('base_id', flat=True)))
+
+    def test_update_workers(self):
+        c = self._crawler(EntitiesCrawler)
+
+        mods = c.update(0, 10, workers=4)
+        self.assertEqual(11, mods['added'])
+        self.assertEqual(11, models.Entity.objects.count())
+
+        # concurrent retrieval yields the same result as a sequential one
+        mods = c.update(0, 10)
+        self.assertEqual(0, mods['added'])
+        self.assertEqual(0, mods['updated'])
+
+    def test_update_prefetch(self):
+        c = self._crawler(EntitiesCrawler)
+
+        mods = c.update(0, 20, items_per_batch=5, prefetch=2)
+        self.assertEqual(21, mods['added'])
+        self.assertEqual(21, models.Entity.objects.count())
+
+        mods = c.update(0, 20, items_per_batch=5)
+        self.assertEqual(0, mods['added'])
+        self.assertEqual(0, mods['updated'])
+
+    def test_update_bulk(self):
+        models.Country.objects.all().delete()
+        self._crawler(ContractsStaticDataCrawler).retrieve_and_save_all()
+
+        c = self._crawler(ContractsCrawler)
+        mods = c.update(items_per_batch=4, workers=3, bulk=True)
+        self.assertEqual(10, mods['added'])
+        self.assertEqual(10, models.Contract.objects.count())
+
+        # bulk creation yields the same result as saving one by one
+        mods = c.update(items_per_batch=4)
+        self.assertEqual({'added': 0, 'updated': 0, 'deleted': 0}, mods)
+
+    def test_adjacent_shards(self):
+        c = self._crawler(EntitiesCrawler)
+        self.assertEqual(3, c.create_shards(shard_size=10))
+
+        mods = c.update_shard(c.claim_shard('w1'), items_per_batch=4)
+        # rows [0, 10): the first row of the next shard is not synchronized
+        self.assertEqual(10, mods['added'])
+        self.assertEqual(list(range(1, 11)), sorted(
+            models.Entity.objects.values_list('base_id', flat=True)))
+
+        mods = c.update_shard(c.claim_shard('w2'), items_per_batch=4)
+        self.assertEqual(10, mods['added'])
+        self.assertEqual(20, models.Entity.objects.count())
+
+    def test_resume(self):
+        c = self._crawler(EntitiesCrawler)
+        c.update(0, 10)
+
+        checkpoint = models.CrawlerCheckpoint.objects.get(object_name='entity',
+                                                          start=0)
+        self.assertTrue(checkpoint.is_finished)
+        self.assertEqual(10, checkpoint.position)
+        self.assertEqual(11, checkpoint.added)
+
+        # simulate an interruption after row 5
+        models.Entity.objects.all().delete()
+        checkpoint.position = 5
+        checkpoint.is_finished = False
+        checkpoint.save()
+
+        mods = c.update(0, 10, resume=True)
+        # only rows 5-10 were synchronized
+        self.assertEqual(6, models.Entity.objects.count())
+        self.assertEqual(11 + 6, mods['added'])
+
+        # a finished synchronization is not repeated...
+        mods = c.update(0, 10, resume=True)
+        self.assertEqual(11 + 6, mods['added'])
+        self.assertEqual(6, models.Entity.objects.count())
+
+        # ...but continued until new rows
+        mods = c.update(0, 12, resume=True)
+        self.assertEqual(11 + 6 + 2, mods['added'])
+        self.assertEqual(8, models.Entity.objects.count())
+
+        # a synchronization that is not resumed starts from scratch
+        mods = c.update(0, 12)
+        self.assertEqual(5, mods['added'])
+
+
 @skipUnless(HAS_REMOTE_ACCESS, 'Can\'t reach BASE')
 class DynamicCrawlerTestCase(TestCase):
 
@@ -6,7 +6,7 @@ from django.test import TestCase
 
 from contracts.crawler_forms import PriceField, clean_place, TimeDeltaField, \
     CPVSField, CountryChoiceField, ContractTypeField, EntitiesField, TenderForm, \
-    CouncilChoiceField, CategoryField
+    CouncilChoiceField, CategoryField, lookup_cache
 from contracts import models
 
 from contracts.test import HAS_REMOTE_ACCESS
@@ -129,6 +129,72 @@ class CouncilChoiceFieldTestCase(TestCase):
         self.assertEqual(self.field.clean(value), c)
 
 
+class LookupCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.pt = models.Country.objects.create(name='Portugal')
+        self.d = models.District.objects.create(name='Viseu', country=self.pt,
+                                                base_id=1)
+        self.c = models.Council.objects.create(name='Viseu', district=self.d,
+                                               base_id=1)
+
+    def test_country(self):
+        field = CountryChoiceField(required=False)
+        with lookup_cache:
+            with self.assertNumQueries(1):
+                self.assertEqual(self.pt, field.clean('Portugal'))
+                self.assertEqual(self.pt, field.clean('Portugal'))
+                self.assertRaises(ValidationError, field.clean, 'Non-country')
+
+            # new rows are only seen after invalidation
+            de = models.Country.objects.create(name='Alemanha')
+            self.assertRaises(ValidationError, field.clean, 'Alemanha')
+            lookup_cache.invalidate(models.Country)
+            self.assertEqual(de, field.clean('Alemanha'))
+
+    def test_duplicated_country(self):
+        models.Country.objects.create(name='Portugal')
+        field = CountryChoiceField(required=False)
+
+        with lookup_cache:
+            # like the database, the cache doesn't pick one of them
+            self.assertRaises(models.Country.MultipleObjectsReturned,
+                              field.clean, 'Portugal')
+        self.assertRaises(models.Country.MultipleObjectsReturned,
+                          field.clean, 'Portugal')
+
+    def test_council(self):
+        field = CouncilChoiceField(required=False)
+        value = {'council': 'Viseu', 'district': 'Viseu'}
+        with lookup_cache:
+            with self.assertNumQueries(1):
+                self.assertEqual(self.c, field.clean(value))
+                self.assertEqual(self.c, field.clean(value))
+
+    def test_council_district_renamed(self):
+        field = CouncilChoiceField(required=False)
+        with lookup_cache:
+            field.clean({'council': 'Viseu', 'district': 'Viseu'})
+
+            self.d.name = 'Distrito de Viseu'
+            self.d.save()
+            lookup_cache.invalidate(models.District)
+
+            # councils are looked up by the new name of their district
+            self.assertEqual(self.c, field.clean(
+                {'council': 'Viseu', 'district': 'Distrito de Viseu'}))
+
+    def test_inactive(self):
+        field = CountryChoiceField(required=False)
+        with lookup_cache:
+            field.clean('Portugal')
+
+        # outside a crawl, the database is used
+        with self.assertNumQueries(1):
+            self.assertEqual(self.pt, field.clean('Portugal'))
+        self.assertFalse(lookup_cache.is_active)
+
+
 class TenderFormTestCase(TestCase):
     def test_date_from_url(self):
         date = datetime.date(year=2010, month=8, day=12)
@@ -0,0 +1,106 @@
+from django.test import TestCase
+import requests
+import requests.exceptions
+
+from contracts.crawler_scheduler import RequestScheduler
+
+
+class Response(requests.Response):
+
+    def __init__(self, status):
+        super(Response, self).__init__()
+        self.status_code = status
+        self._content = b'[]'
+        self._content_consumed = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Session:
+    """
+    A session that answers requests with the given status codes (or raises
+    a `ConnectionError` for `None`) in order.
+    """
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.requests = 0
+        self.responses = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests += 1
+        status = self.statuses.pop(0)
+        if status is None:
+            raise requests.exceptions.ConnectionError()
+        self.responses.append(Response(status))
+        return self.responses[-1]
+
+
+class RequestSchedulerTestCase(TestCase):
+
+    def setUp(self):
+        self.scheduler = RequestScheduler(initial_concurrency=4, retries=2,
+                                          backoff=0, reset_timeout=0)
+
+    def test_retry(self):
+        session = Session([500, None, 200])
+
+        response = self.scheduler.request(session, 'http://a/b')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, session.requests)
+        # halved twice, and increased once
+        self.assertEqual(2, self.scheduler.concurrency('http://a/c'))
+
+    def test_close_failed(self):
+        session = Session([503, 200])
+
+        response = self.scheduler.request(session, 'http://a/b', stream=True)
+        # the failed response was closed before retrying
+        self.assertTrue(session.responses[0].closed)
+        self.assertFalse(response.closed)
+
+    def test_consume(self):
+        session = Session([200, 200])
+        reads = []
+
+        def consume(response):
+            reads.append(response)
+            if len(reads) == 1:
+                raise requests.exceptions.ChunkedEncodingError()
+            return response.content
+
+        # the content failed to be read: the request is retried
+        self.assertEqual(b'[]', self.scheduler.request(
+            session, 'http://a/b', consume=consume, stream=True))
+        self.assertEqual(2, session.requests)
+        self.assertTrue(all(response.closed for response in reads))
+
+    def test_fail(self):
+        self.assertRaises(requests.exceptions.HTTPError,
+                          self.scheduler.request, Session([500] * 3), 'http://a')
+        self.assertRaises(requests.exceptions.ConnectionError,
+                          self.scheduler.request, Session([None] * 3),
+                          'http://a')
+
+    def test_increase(self):
+        session = Session([200] * 10)
+        for _ in range(10):
+            self.scheduler.request(session, 'http://a')
+
+        self.assertTrue(self.scheduler.concurrency('http://a') > 5)
+        # other hosts are independent
+        self.assertEqual(4, self.scheduler.concurrency('http://b'))
+
+    def test_circuit(self):
+        self.scheduler.failure_threshold = 2
+        self.scheduler.reset_timeout = 0.1
+
+        self.assertRaises(requests.exceptions.HTTPError,
+                          self.scheduler.request, Session([500] * 3), 'http://a')
+        host = self.scheduler._get_host('http://a')
+        self.assertNotEqual(None, host.open_until)
+
+        # the host recovered
+        self.scheduler.request(Session([200]), 'http://a')
+        self.assertEqual(None, host.open_until)
@@ -0,0 +1,131 @@
+import shutil
+import tempfile
+
+from django.test import TestCase
+import requests
+
+from contracts.crawler import ContractsCrawler, ContractsStaticDataCrawler
+from contracts.crawler_forms import EntitiesField
+from contracts.crawler_store import FileResponseStore, ResponseNotStored
+from contracts import models
+from contracts.tools.fake_base import FakeBase, start_server, server_url
+
+
+class Session:
+    """
+    A session that answers every request with the same content.
+    """
+    def __init__(self, content=b'[]', etag='"1"'):
+        self.content = content
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None):
+        self.requests.append(headers)
+        response = requests.Response()
+        response.url = url
+        response.encoding = 'utf-8'
+        response.headers['ETag'] = self.etag
+        if headers.get('If-None-Match') == self.etag:
+            response.status_code = 304
+            response._content = b''
+        else:
+            response.status_code = 200
+            response._content = self.content
+        return response
+
+
+class FileResponseStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.session = Session(b'[{"id": 1}]')
+        self.get = self.session.get
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replay(self):
+        store = FileResponseStore(self.directory)
+
+        response = store.get_response(self.get, 'http://a', {'Range': '1'})
+        self.assertEqual('[{"id": 1}]', response.text)
+
+        response = store.get_response(self.get, 'http://a', {'Range': '1'})
+        self.assertEqual('[{"id": 1}]', response.text)
+        self.assertEqual('"1"', response.headers['etag'])
+        self.assertEqual(1, len(self.session.requests))
+
+        # a different range is a different request
+        store.get_response(self.get, 'http://a', {'Range': '2'})
+        self.assertEqual(2, len(self.session.requests))
+
+    def test_offline(self):
+        FileResponseStore(self.directory).get_response(self.get, 'http://a')
+
+        store = FileResponseStore(self.directory, offline=True)
+        self.assertEqual('[{"id": 1}]',
+                         store.get_response(self.get, 'http://a').text)
+        self.assertRaises(ResponseNotStored, store.get_response, self.get,
+                          'http://b')
+        self.assertEqual(1, len(self.session.requests))
+
+    def test_conditional_request(self):
+        store = FileResponseStore(self.directory, max_age=0)
+        store.get_response(self.get, 'http://a')
+
+        response = store.get_response(self.get, 'http://a')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('[{"id": 1}]', response.text)
+        self.assertEqual('"1"', self.session.requests[1]['If-None-Match'])
+
+
+class OfflineReplayTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = start_server(FakeBase(contracts=1, entities=10,
+                                            tenders=0))
+
+        crawler = ContractsStaticDataCrawler()
+        crawler.session.proxies = {'http': server_url(self.server)}
+        crawler.retrieve_and_save_all()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def _crawler(self, **kwargs):
+        crawler = ContractsCrawler(FileResponseStore(self.directory, **kwargs))
+        crawler.session.proxies = {'http': server_url(self.server)}
+        return crawler
+
+    def test_missing_entity(self):
+        contract = self._crawler().update_instance(1)[0]
+        entities = sorted(models.Entity.objects.values_list('base_id',
+                                                            flat=True))
+        self.assertTrue(entities)
+
+        models.Contract.objects.all().delete()
+        models.Entity.objects.all().delete()
+
+        # BASE is down: the entities missing when the contract is validated
+        # are also replayed from the store.
+        self.server.shutdown()
+        contract = self._crawler(offline=True).update_instance(1)[0]
+
+        self.assertEqual(1, contract.base_id)
+        self.assertEqual(entities, sorted(
+            models.Entity.objects.values_list('base_id', flat=True)))
+
+        # other validations don't use the store of the crawler
+        self.assertEqual(None, EntitiesField.get_crawler().store)
+
+    def test_entity_not_stored(self):
+        crawler = self._crawler()
+        crawler.get_json(crawler.object_url % 1)
+
+        self.assertRaises(ResponseNotStored,
+                          self._crawler(offline=True).update_instance, 1)
+        self.assertEqual(0, models.Entity.objects.count())
@@ -0,0 +1,64 @@
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+
+from contracts.crawler import ContractsCrawler, EntitiesCrawler, \
+    TendersCrawler, ContractsStaticDataCrawler
+from contracts import models
+from contracts.tools.fake_base import FakeBase, start_server, server_url
+
+
+class FakeBaseTestCase(TestCase):
+
+    def setUp(self):
+        self.server = start_server(FakeBase(contracts=30, entities=10,
+                                            tenders=5))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _crawler(self, crawler_class):
+        crawler = crawler_class()
+        crawler.session.proxies = {'http': server_url(self.server)}
+        return crawler
+
+    def test_crawl(self):
+        self._crawler(ContractsStaticDataCrawler).retrieve_and_save_all()
+        self.assertEqual(7, models.Council.objects.count())
+
+        self.assertEqual(30, self._crawler(ContractsCrawler)
+                         .update(items_per_batch=7, bulk=True)['added'])
+        self.assertEqual(5, self._crawler(TendersCrawler)
+                         .update(items_per_batch=7)['added'])
+
+        # entities were retrieved with the contracts and tenders
+        mods = self._crawler(EntitiesCrawler).update()
+        self.assertEqual({'added': 0, 'updated': 0, 'deleted': 0}, mods)
+        self.assertEqual(10, models.Entity.objects.count())
+        self.assertFalse(models.Entity.objects.filter(fingerprint=None)
+                         .exists())
+
+        # nothing changed
+        mods = self._crawler(ContractsCrawler).update(items_per_batch=7)
+        self.assertEqual({'added': 0, 'updated': 0, 'deleted': 0}, mods)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_crawler', contracts=20, entities=5, tenders=5,
+                     stdout=out)
+
+        self.assertIn('contract: ', out.getvalue())
+        # the crawled data is deleted
+        self.assertEqual(0, models.Contract.objects.count())
+        self.assertEqual(0, models.Entity.objects.count())
+        self.assertEqual(0, models.Council.objects.count())
+
+    def test_benchmark_existing_data(self):
+        models.Entity.objects.create(name='test', base_id=1, nif='nif')
+
+        self.assertRaises(CommandError, call_command, 'benchmark_crawler',
+                          contracts=20, entities=5, tenders=5,
+                          stdout=StringIO())
+        self.assertEqual('test', models.Entity.objects.get(base_id=1).name)
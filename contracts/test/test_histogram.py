@@ -0,0 +1,48 @@
+from datetime import date
+
+from django.test import TestCase
+import numpy as np
+
+from contracts.analysis.histogram import log_edges, linear_edges, histogram, \
+    to_series, contracts_price_histogram
+from contracts.models import Contract
+
+
+class HistogramTestCase(TestCase):
+
+    def test_edges(self):
+        self.assertEqual([2, 4, 8, 16], log_edges(bins=3).tolist())
+        self.assertEqual([0, 5, 10], linear_edges(0, 10, 2).tolist())
+
+    def test_histogram(self):
+        counts = histogram(np.array([1, 2, 3, 4, 7, 8, 16]), log_edges(bins=3))
+
+        # 1 and 16 are outside the bins; edges belong to the bin they start.
+        self.assertEqual([2, 2, 1], counts.tolist())
+
+    def test_to_series(self):
+        edges = log_edges(bins=3)
+        series = to_series(edges, [np.array([2, 0, 1]), np.array([0, 0, 3])],
+                           key='value', min_count=2)
+
+        self.assertEqual([[{'min_value': 2, 'max_value': 4, 'value': 2},
+                           {'min_value': 8, 'max_value': 16, 'value': 1}],
+                          [{'min_value': 2, 'max_value': 4, 'value': 0},
+                           {'min_value': 8, 'max_value': 16, 'value': 3}]],
+                         series)
+
+    def test_filters(self):
+        for base_id in range(10):
+            year = 2010 + base_id % 2
+            Contract.objects.create(
+                base_id=base_id, contract_description='da',
+                price=1000 + 200*(base_id % 2),
+                added_date=date(year, 1, 1), signing_date=date(year, 1, 1))
+
+        self.assertEqual([{'min_value': 8, 'max_value': 16, 'count': 10}],
+                         contracts_price_histogram())
+        # bins with 5 or less contracts are omitted.
+        self.assertEqual([], contracts_price_histogram(
+            signing_date__year=2011))
+        # 10 euros is above the last bin.
+        self.assertEqual([], contracts_price_histogram(bins=2))
@@ -0,0 +1,60 @@
+from datetime import date
+
+from django.test import TestCase
+import numpy as np
+
+from contracts.analysis.inequality import lorenz_curve, \
+    contracted_lorenz_curve
+from contracts.models import Contract, Entity
+
+
+class LorenzCurveTestCase(TestCase):
+
+    def test_curve(self):
+        rank, cumulative, gini_index = lorenz_curve(np.array([1., 1., 2.]))
+
+        self.assertEqual([0, 0.5, 1], rank.tolist())
+        self.assertEqual([0.25, 0.5, 1], cumulative.tolist())
+        self.assertAlmostEqual(1 - 2*(0.25 + 0.5 + 1)/3, gini_index)
+
+    def test_down_sample(self):
+        rank, cumulative, _ = lorenz_curve(np.arange(1., 1001.),
+                                           number_of_points=300)
+
+        # every third point, the last one included.
+        self.assertEqual(334, len(rank))
+        self.assertEqual(0, rank[0])
+        self.assertEqual(1, rank[-1])
+        self.assertEqual(1, cumulative[-1])
+
+    def test_empty(self):
+        rank, cumulative, gini_index = lorenz_curve(np.zeros(0))
+        self.assertEqual(([], [], 0),
+                         (rank.tolist(), cumulative.tolist(), gini_index))
+
+    def test_segment(self):
+        e1 = Entity.objects.create(name='test1', base_id=1, nif='nif')
+        e2 = Entity.objects.create(name='test2', base_id=2, nif='nif')
+        e3 = Entity.objects.create(name='test3', base_id=3, nif='nif')
+
+        for base_id, price, year, entity in ((1, 1000, 2010, e2),
+                                             (2, 2000, 2010, e3),
+                                             (3, 3000, 2011, e3)):
+            c = Contract.objects.create(
+                base_id=base_id, contract_description='da', price=price,
+                added_date=date(year, 1, 1), signing_date=date(year, 1, 1))
+            c.contractors.add(e1)
+            c.contracted.add(entity)
+
+        for entity in (e1, e2, e3):
+            entity.compute_data()
+
+        _, cumulative, _ = contracted_lorenz_curve()
+        self.assertEqual([1/6, 1], cumulative.tolist())
+
+        _, cumulative, _ = contracted_lorenz_curve(signing_date__year=2010)
+        self.assertEqual([1/3, 1], cumulative.tolist())
+
+        # e2 has no contracts in 2011.
+        rank, cumulative, _ = contracted_lorenz_curve(signing_date__year=2011)
+        self.assertEqual(([0], [1]), (rank.tolist(), cumulative.tolist()))
@@ -0,0 +1,35 @@
+from django.test import TestCase
+
+from contracts.analysis.pivot import pivot, to_series
+
+
+class PivotTestCase(TestCase):
+
+    rows = [{'procedure': 'b', 'month': '2011-02', 'district': 1, 'count': 1},
+            {'procedure': 'a', 'month': '2011-01', 'district': 1, 'count': 2},
+            {'procedure': 'a', 'month': '2011-01', 'district': 2, 'count': 3}]
+
+    def test_pivot(self):
+        grid = pivot(self.rows, ('procedure', 'month'), ('count',))
+
+        self.assertEqual([['a', 'b'], ['2011-01', '2011-02']], grid['labels'])
+        # rows of both districts are summed; missing cells are zero.
+        self.assertEqual([[5, 0], [0, 1]], grid['count'].tolist())
+
+        grid = pivot(self.rows, ('district',), ('count',))
+        self.assertEqual([3, 3], grid['count'].tolist())
+
+    def test_to_series(self):
+        grid = pivot(self.rows, ('procedure', 'month'), ('count',))
+
+        self.assertEqual([{'key': 'a', 'values': [
+                              {'month': '2011-01', 'count': 5},
+                              {'month': '2011-02', 'count': 0}]},
+                          {'key': 'b', 'values': [
+                              {'month': '2011-01', 'count': 0},
+                              {'month': '2011-02', 'count': 1}]}],
+                         to_series(grid, 'month', ('count',)))
+
+    def test_empty(self):
+        grid = pivot([], ('procedure', 'month'), ('count',))
+        self.assertEqual([], to_series(grid, 'month', ('count',)))
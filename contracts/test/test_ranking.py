@@ -0,0 +1,20 @@
+from django.test import TestCase
+import numpy as np
+
+from contracts.analysis.ranking import competition_rank
+
+
+class CompetitionRankTestCase(TestCase):
+
+    def test_ascending(self):
+        ranks = competition_rank(np.array([3., 1., 1., np.nan, 2.]))
+        self.assertEqual([4, 1, 1, 0, 3], ranks.tolist())
+
+    def test_descending(self):
+        ranks = competition_rank(np.array([3., 1., 1., np.nan, 3.]),
+                                 descending=True)
+        self.assertEqual([1, 3, 3, 0, 1], ranks.tolist())
+
+    def test_empty(self):
+        self.assertEqual([], competition_rank(np.zeros(0)).tolist())
+        self.assertEqual([0], competition_rank(np.array([np.nan])).tolist())
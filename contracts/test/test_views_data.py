@@ -1,8 +1,10 @@
 from datetime import datetime, date
+import json
 
 import django.test
 
-from contracts.models import Contract, Entity, ProcedureType
+from contracts.models import Contract, Entity, ProcedureType, \
+    update_contracts_rollup
 from contracts.views_data import *
 from contracts.views_analysis import ANALYSIS
 
@@ -126,6 +128,8 @@ class TestAnalysis(django.test.TestCase):
             procedure_type=p2,
         )
 
+        update_contracts_rollup()
+
         expected = [{'key': 'Test1', 'values':
             [{'value': 10, 'month': '2011-01', 'count': 1},
              {'value': 0, 'month': '2011-02', 'count': 0}
@@ -178,6 +182,8 @@ class TestAnalysis(django.test.TestCase):
         c2.contractors.add(e1)
         c2.contracted.add(e2)
 
+        update_contracts_rollup()
+
         response = self.client.get(
             reverse(analysis_selector, args=('municipalities-contracts-time-'
                                              'series-json',)))
@@ -229,6 +235,41 @@ class TestAnalysis(django.test.TestCase):
 
         self.assertEqual(expected, result)
 
+    def test_contract_of_two_municipalities(self):
+        # e1 and e2 are municipalities contracting together
+        e1 = Entity.objects.create(name='test1', base_id=1, nif='506780902')
+        e2 = Entity.objects.create(name='test2', base_id=2, nif='506572218')
+        p1 = ProcedureType.objects.create(name='Test1', base_id=1)
+
+        c1 = Contract.objects.create(
+            base_id=1, contract_description='da', price=1000,
+            added_date=datetime(year=2011, month=1, day=1),
+            signing_date=datetime(year=2011, month=1, day=1),
+            procedure_type=p1)
+
+        c1.contractors.add(e1, e2)
+
+        update_contracts_rollup()
+
+        response = self.client.get(
+            reverse(analysis_selector, args=('municipalities-contracts-time-'
+                                             'series-json',)))
+        result = json.loads(response.content.decode('utf-8'))
+
+        # the contract is counted once.
+        self.assertEqual([{'value': 1, 'month': '2011-01'}],
+                         result[0]['values'])
+        self.assertEqual([{'value': 10, 'month': '2011-01'}],
+                         result[1]['values'])
+
+        response = self.client.get(
+            reverse(analysis_selector, args=('municipalities-procedure-types-'
+                                             'time-series-json',)))
+        result = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual([{'key': 'Test1', 'values': [
+            {'value': 10, 'month': '2011-01', 'count': 1}]}], result)
+
     def test_lorenz_curve(self):
         # e1 always contracts; e2 and e3 receive
         e1 = Entity.objects.create(name='test1', base_id=1, nif='nif')
@@ -297,6 +338,8 @@ class TestAnalysis(django.test.TestCase):
 
         c3.contractors.add(e2)
 
+        update_contracts_rollup()
+
         response = self.client.get(
             reverse(analysis_selector, args=('municipalities-ranking-json',)))
         self.assertEqual(200, response.status_code)
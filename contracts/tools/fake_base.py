@@ -0,0 +1,252 @@
+"""
+A local stand-in of BASE's REST API serving synthetic data, used to measure
+the crawler without hitting base.gov.pt.
+
+The server acts as an HTTP proxy of `www.base.gov.pt`, so crawlers use it
+without changes to their urls, e.g.::
+
+    server = start_server(FakeBase(contracts=100000))
+    crawler = ContractsCrawler()
+    crawler.session.proxies = {'http': server_url(server)}
+
+Lists of contracts, entities and tenders support the `Range: items=a-b`
+header and answer with `content-range: items a-b/total`, like BASE does.
+"""
+import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import random
+import re
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+
+CONTRACT_TYPES = ['Aquisição de bens móveis', 'Aquisição de serviços',
+                  'Empreitadas de obras públicas', 'Outros']
+PROCEDURE_TYPES = ['Ajuste directo', 'Concurso público',
+                   'Concurso limitado por prévia qualificação']
+ACT_TYPES = ['Anúncio de procedimento', 'Declaração de rectificação de anúncio']
+MODEL_TYPES = ['Concurso público', 'Concurso limitado por prévia qualificação']
+COUNTRIES = {187: 'Portugal', 1: 'Espanha'}
+# district base_id -> (name, {council base_id: name})
+DISTRICTS = {1: ('Faro', {1: 'Faro', 2: 'Loulé', 3: 'Lagos'}),
+             2: ('Lisboa', {4: 'Lisboa', 5: 'Sintra'}),
+             3: ('Porto', {6: 'Porto', 7: 'Maia'})}
+CPVS = ['45000000-7', '30000000-9', '79000000-4', 'Não definido.']
+
+FIRST_DATE = datetime.date(2009, 1, 1)
+
+
+def _format_date(date):
+    return date.strftime('%d-%m-%Y')
+
+
+def _format_price(cents):
+    return '{:,}'.format(cents // 100).replace(',', '.') + \
+        ',%02d €' % (cents % 100)
+
+
+class FakeBase:
+    """
+    Synthetic data of BASE with `contracts`, `entities` and `tenders` items,
+    each generated deterministically from its id. Every response is delayed
+    by `latency` seconds.
+    """
+    def __init__(self, contracts=10000, entities=1000, tenders=1000,
+                 latency=0):
+        self.counts = {'contratos': contracts, 'entidades': entities,
+                       'anuncios': tenders}
+        self.latency = latency
+
+    def _date(self, name, base_id):
+        # items are spread over ~5 years in the order of their ids.
+        days = 5*365 * base_id // (self.counts[name] + 1)
+        return FIRST_DATE + datetime.timedelta(days=days)
+
+    def _entities(self, rng, count):
+        entities = range(1, self.counts['entidades'] + 1)
+        return [{'id': base_id}
+                for base_id in rng.sample(entities, min(count, len(entities)))]
+
+    def entity(self, base_id):
+        return {'id': base_id,
+                'description': 'Entity %d' % base_id,
+                'nif': '%09d' % (500000000 + base_id),
+                'location': 'Portugal'}
+
+    def entity_list_item(self, base_id):
+        entity = self.entity(base_id)
+        return {'id': base_id, 'nif': entity['nif'],
+                'description': entity['description']}
+
+    def contract(self, base_id):
+        rng = random.Random('contract-%d' % base_id)
+        district = rng.choice(sorted(DISTRICTS))
+        name, councils = DISTRICTS[district]
+        date = self._date('contratos', base_id)
+        return {'id': base_id,
+                'contractingProcedureType': rng.choice(PROCEDURE_TYPES),
+                'contractTypes': rng.choice(CONTRACT_TYPES),
+                'objectBriefDescription': 'Contract %d' % base_id,
+                'description': 'Description of contract %d' % base_id,
+                'signingDate': _format_date(date),
+                'publicationDate': _format_date(
+                    date + datetime.timedelta(days=rng.randint(0, 30))),
+                'cpvs': rng.choice(CPVS),
+                'initialContractualPrice': _format_price(
+                    int(rng.lognormvariate(14, 2))),
+                'executionPlace': 'Portugal, %s, %s' % (
+                    name, councils[rng.choice(sorted(councils))]),
+                'contracting': self._entities(rng, 1),
+                'contracted': self._entities(rng, rng.randint(1, 2))}
+
+    def contract_list_item(self, base_id):
+        contract = self.contract(base_id)
+        keys = ('id', 'contractingProcedureType', 'objectBriefDescription',
+                'signingDate', 'publicationDate', 'initialContractualPrice',
+                'contracting', 'contracted')
+        return dict((key, contract[key]) for key in keys)
+
+    def tender(self, base_id):
+        rng = random.Random('tender-%d' % base_id)
+        date = self._date('anuncios', base_id)
+        return {'id': base_id,
+                'type': rng.choice(ACT_TYPES),
+                'modelType': rng.choice(MODEL_TYPES),
+                'contractType': rng.choice(CONTRACT_TYPES),
+                'contractDesignation': 'Tender %d' % base_id,
+                'announcementNumber': '%d/%d' % (base_id, date.year),
+                'reference': 'http://dre.pt/?data=%s&' % date.isoformat(),
+                'drPublicationDate': _format_date(date),
+                'proposalDeadline': '%d dias.' % rng.randint(5, 60),
+                'cpvs': rng.choice(CPVS),
+                'basePrice': _format_price(int(rng.lognormvariate(14, 2))),
+                'contractingEntities': self._entities(rng, 1)}
+
+    def tender_list_item(self, base_id):
+        tender = self.tender(base_id)
+        keys = ('id', 'contractDesignation', 'drPublicationDate', 'basePrice',
+                'contractingEntities')
+        return dict((key, tender[key]) for key in keys)
+
+    def static_list(self, name, query):
+        """
+        Returns the items of the list `name` of static data.
+        """
+        def items(names):
+            return [{'id': '0', 'description': 'Todos'}] + \
+                [{'id': str(i), 'description': name}
+                 for i, name in enumerate(names, 1)]
+
+        if name == 'tipocontratos':
+            return items(CONTRACT_TYPES)
+        if name == 'tipoprocedimentos':
+            return items(PROCEDURE_TYPES)
+        if name == 'tiposacto':
+            return items(ACT_TYPES)
+        if name == 'tiposmodelo':
+            return items(MODEL_TYPES)
+        if name == 'paises':
+            return [{'id': str(i), 'description': country}
+                    for i, country in sorted(COUNTRIES.items())]
+        if name == 'distritos':
+            return [{'id': str(i), 'description': DISTRICTS[i][0]}
+                    for i in sorted(DISTRICTS)]
+        if name == 'concelhos':
+            councils = DISTRICTS[int(query['distrito'][0])][1]
+            return [{'id': str(i), 'description': councils[i]}
+                    for i in sorted(councils)]
+        return None
+
+    def response(self, path, headers):
+        """
+        Returns `(status, headers, data)` of a request to BASE's `path`.
+        """
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+        if parts[:2] != ['base2', 'rest'] or len(parts) < 3:
+            return 404, {}, None
+        parts = parts[2:]
+
+        if parts[0] == 'lista' and len(parts) == 2:
+            items = self.static_list(parts[1], query)
+            if items is None:
+                return 404, {}, None
+            return 200, {}, {'items': items}
+
+        name = parts[0]
+        if name not in self.counts:
+            return 404, {}, None
+        count = self.counts[name]
+        item, list_item = {
+            'contratos': (self.contract, self.contract_list_item),
+            'entidades': (self.entity, self.entity_list_item),
+            'anuncios': (self.tender, self.tender_list_item)}[name]
+
+        if len(parts) == 2:
+            base_id = int(parts[1])
+            if not 1 <= base_id <= count:
+                # the BASE way of saying that the object doesn't exist.
+                return 200, {}, {'id': 0}
+            return 200, {}, item(base_id)
+
+        # rows are [row1, row2] and the item of row `r` has id `r + 1`.
+        match = re.match(r'items=(\d+)-(\d+)', headers.get('Range', ''))
+        if match:
+            row1, row2 = int(match.group(1)), int(match.group(2))
+        else:
+            row1, row2 = 0, 24
+        row2 = min(row2, count - 1)
+
+        data = [list_item(row + 1) for row in range(row1, row2 + 1)]
+        if data:
+            content_range = 'items %d-%d/%d' % (row1, row2, count)
+        else:
+            content_range = 'items */%d' % count
+        return 200, {'content-range': content_range}, data
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        base = self.server.base
+        if base.latency:
+            time.sleep(base.latency)
+
+        status, headers, data = base.response(self.path, self.headers)
+        content = json.dumps(data).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_server(base, port=0):
+    """
+    Starts a server of `base` (a `FakeBase`) in a background thread. Returns
+    the server; use `server.shutdown()` to stop it.
+    """
+    server = _Server(('127.0.0.1', port), _Handler)
+    server.base = base
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def server_url(server):
+    return 'http://%s:%d' % server.server_address
@@ -86,7 +86,8 @@ class ContractedLorenzCurveView(AnalysisView):
     def build_context(self, context):
         context = super(ContractedLorenzCurveView, self).build_context(context)
 
-        _, gini_index = analysis_manager.get_analysis('contracted_lorenz_curve')
+        _, _, gini_index = \
+            analysis_manager.get_analysis('contracted_lorenz_curve')
 
         context['gini_index'] = gini_index
         return context
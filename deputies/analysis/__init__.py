@@ -1,10 +1,18 @@
-from main.analysis import AnalysisManager, Analysis
+from main.analysis import AnalysisManager, Analysis, Payload, \
+    get_default_store
 
 from deputies.analysis.analysis import *
 
 _allAnalysis = [Analysis('deputies_time_distribution', get_time_in_office_distribution),
                 Analysis('mandates_distribution', get_mandates_in_office_distribution)]
 
+# payloads of the data endpoints, rendered by `deputies.views_data`.
+_allPayloads = [
+    Payload('deputies-time-distribution-json',
+            'deputies.views_data.deputies_time_distribution_json'),
+    Payload('mandates-distribution-json',
+            'deputies.views_data.mandates_distribution_json')]
+
 
 ANALYSIS = {'deputies_time_distribution': 1,
             'mandates_distribution': 2}
@@ -13,6 +21,8 @@ PRIMARY_KEY = dict()
 for k, v in ANALYSIS.items():
     PRIMARY_KEY[v] = k
 
-analysis_manager = AnalysisManager()
+analysis_manager = AnalysisManager(get_default_store())
 for x in _allAnalysis:
     analysis_manager.register(x, primary_key=ANALYSIS[x.name])
+for x in _allPayloads:
+    analysis_manager.register_payload(x)
@@ -15,8 +15,7 @@ def update_deputies():
 
 def recompute_analysis():
     # update analysis
-    for analysis in list(analysis_manager.values()):
-        analysis.update()
+    analysis_manager.refresh_all()
 
 
 def update():
@@ -1,4 +1,5 @@
-from main.analysis import AnalysisManager, Analysis
+from main.analysis import AnalysisManager, Analysis, Payload, \
+    get_default_store
 
 from law.analysis.analysis import get_documents_time_series,\
     get_eu_impact_time_series,\
@@ -10,6 +11,11 @@ _allAnalysis = [
     Analysis('law_eu_impact_time_series', get_eu_impact_time_series),
     Analysis('law_types_time_series', get_types_time_series)]
 
+# payloads of the data endpoints, rendered by `law.views_data`.
+_allPayloads = [
+    Payload('law-types-time-series-json',
+            'law.views_data.law_types_time_series_json')]
+
 ANALYSIS = {'law_count_time_series': 1,
             'law_eu_impact_time_series': 2,
             'law_types_time_series': 3}
@@ -18,6 +24,8 @@ PRIMARY_KEY = dict()
 for k, v in ANALYSIS.items():
     PRIMARY_KEY[v] = k
 
-analysis_manager = AnalysisManager()
+analysis_manager = AnalysisManager(get_default_store())
 for x in _allAnalysis:
     analysis_manager.register(x, primary_key=ANALYSIS[x.name])
+for x in _allPayloads:
+    analysis_manager.register_payload(x)
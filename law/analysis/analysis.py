@@ -41,6 +41,7 @@ def get_eu_impact_time_series():
     # which are used to refer documents from EU.
     regex = re.compile(r'eurlex\.asp\?ano=(\d+)&amp;id=(\w+)')
 
+    data = []
     final_result = {}
     for year in range(1985, 2014):
         # we exclude types that are summaries and technical sheets
@@ -67,7 +68,9 @@ def get_eu_impact_time_series():
 
         final_result[year] = sum(aggregate)  # number of documents
 
-        yield (year, final_result[year]/documents.count()*100)
+        data.append((year, final_result[year]/documents.count()*100))
+
+    return data
 
 
 def get_types_time_series():
@@ -24,8 +24,7 @@ def update_database(from_year=datetime.datetime.now().date().year,
 
 
 def update_analysis():
-    for analysis in list(analysis_manager.values()):
-        analysis.update()
+    analysis_manager.refresh_all()
 
 
 def update():
@@ -1,11 +1,11 @@
-import json
+from django.http import Http404
 
-from django.http import HttpResponse, Http404
+from main.analysis import payload_response
 
 from law.analysis import analysis_manager
 
 
-def law_types_time_series_json(_):
+def law_types_time_series_json():
     data, types_total = analysis_manager.get_analysis('law_types_time_series')
 
     total_documents = sum(types_total.values())
@@ -53,17 +53,12 @@ def law_types_time_series_json(_):
     # and finally, append the "Others" in the end of the list
     types_time_series.append(others_time_series)
 
-    return HttpResponse(json.dumps(types_time_series),
-                        content_type="application/json")
-
-
-AVAILABLE_VIEWS = {
-    'law-types-time-series-json': law_types_time_series_json,
-    }
+    return types_time_series
 
 
 def analysis_selector(request, analysis_name):
-    if analysis_name not in AVAILABLE_VIEWS:
+    if analysis_name not in analysis_manager.payloads:
         raise Http404
 
-    return AVAILABLE_VIEWS[analysis_name](request)
+    payload = analysis_manager.payloads[analysis_name]
+    return payload_response(request, payload.get())
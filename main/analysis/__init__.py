@@ -1,39 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import time
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
+from django.conf import settings
 from django.core.cache import cache
+from django.db import connection
+
+from .payload import Payload, payload_response, invalidate_payloads
+from .store import FileResultStore
 
 
 class Analysis:
+    """
+    A cached result of calling `function(*args, **kwargs)`.
+
+    The result is fresh for `timeout` seconds. After that, and during
+    `stale_timeout` seconds, it is still served while a single caller
+    recomputes it; other callers do not wait for the new result.
 
-    def __init__(self, name, function, *args, **kwargs):
+    When a `store` is set (see `AnalysisManager`), results are also persisted
+    there and used when the cache is empty. Results cached or stored by a
+    different `version` of the analysis are ignored.
+    """
+    lock_timeout = 60*10
+    poll_interval = 0.5
+
+    def __init__(self, name, function, *args, timeout=60*60*24,
+                 stale_timeout=60*60*24, version=1, **kwargs):
         self.name = name
         self.function = function
         self.args = args
         self.kwargs = kwargs
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.version = version
+        self.store = None
+
+    @property
+    def lock_name(self):
+        return '%s-lock' % self.name
+
+    def _acquire(self):
+        return cache.add(self.lock_name, True, self.lock_timeout)
+
+    def _release(self):
+        cache.delete(self.lock_name)
+
+    def _locked_update(self):
+        try:
+            return self.update()
+        finally:
+            self._release()
+
+    def load(self):
+        """
+        Loads the result from the store into the cache. Returns the cached
+        `(result, expires)` or None if there is no usable stored result.
+        """
+        if self.store is None:
+            return None
+        record = self.store.load(self.name)
+        if record is None or record['version'] != self.version:
+            return None
+
+        expires = record['computed_at'].timestamp() + self.timeout
+        cached = (record['result'], expires)
+        cache.set(self.name, cached,
+                  max(expires - time.time(), 0) + self.stale_timeout,
+                  version=self.version)
+        return cached
 
     def get(self):
-        result = cache.get(self.name)
-        if result is None:
-            result = self.update()
-        return result
+        cached = cache.get(self.name, version=self.version)
+        if cached is None:
+            cached = self.load()
+
+        if cached is not None:
+            result, expires = cached
+            # only the caller that acquires the lock recomputes; the others
+            # use the stale result.
+            if expires < time.time() and self._acquire():
+                result = self._locked_update()
+            return result
+
+        # no result at all: wait while someone else computes it.
+        waited = 0
+        while not self._acquire():
+            if waited >= self.lock_timeout:
+                # whoever had the lock did not finish: compute it ourselves.
+                return self.update()
+            time.sleep(self.poll_interval)
+            waited += self.poll_interval
+            cached = cache.get(self.name, version=self.version)
+            if cached is not None:
+                return cached[0]
+        return self._locked_update()
 
     def update(self):
         logger.info('Updating analysis "%s"', self.name)
         result = self.function(*self.args, **self.kwargs)
-        cache.set(self.name, result, 60*60*24)
+        cache.set(self.name, (result, time.time() + self.timeout),
+                  self.timeout + self.stale_timeout, version=self.version)
+        if self.store is not None:
+            self.store.save(self.name, result, self.version)
+        # payloads are rendered again from the new result.
+        invalidate_payloads()
         return result
 
 
+def get_default_store():
+    """
+    Returns the store defined by the setting `ANALYSIS_STORE` (a directory)
+    or None if it is not defined.
+    """
+    directory = getattr(settings, 'ANALYSIS_STORE', None)
+    if directory:
+        return FileResultStore(directory)
+    return None
+
+
 class AnalysisManager(dict):
 
+    def __init__(self, store=None):
+        super(AnalysisManager, self).__init__()
+        self.store = store
+        self.payloads = {}
+
     def register(self, analysis, primary_key=None):
         analysis.idem = primary_key
+        analysis.store = self.store
         self[analysis.name] = analysis
 
+    def register_payload(self, payload):
+        """
+        Registers the payload of a data endpoint, rendered by `refresh_all`.
+        """
+        self.payloads[payload.name] = payload
+
+    def render_payloads(self):
+        """
+        Renders all payloads in every language of `settings.LANGUAGES`.
+        """
+        for name, payload in sorted(self.payloads.items()):
+            for language, _ in settings.LANGUAGES:
+                try:
+                    payload.render(language)
+                except Exception:
+                    logger.exception('Payload "%s" failed to render', name)
+
     def get_analysis(self, name, flush=False):
         if flush:
             self[name].update()
         return self[name].get()
+
+    def warm_cache(self):
+        """
+        Fills the cache with the stored results of analysis that are not in
+        the cache. Returns the names of the analysis loaded.
+        """
+        return [name for name, analysis in sorted(self.items())
+                if cache.get(name, version=analysis.version) is None and
+                analysis.load() is not None]
+
+    def status(self):
+        """
+        Returns a list of `(name, record)` with the stored record (or None)
+        of each analysis.
+        """
+        if self.store is None:
+            return [(name, None) for name in sorted(self)]
+        return [(name, self.store.load(name)) for name in sorted(self)]
+
+    def _timed_update(self, name, close_connection=False):
+        """
+        Updates the analysis `name` and returns the seconds it took, or None
+        if it failed (its previous result continues to be served).
+        """
+        start = time.time()
+        try:
+            self[name].update()
+        except Exception:
+            logger.exception('Analysis "%s" failed to update', name)
+            return None
+        finally:
+            # each thread uses its own connection to the database.
+            if close_connection:
+                connection.close()
+        duration = time.time() - start
+        logger.info('Analysis "%s" updated in %.2fs', name, duration)
+        return duration
+
+    def refresh_all(self, workers=1):
+        """
+        Updates all analysis using up to `workers` threads, each with its own
+        connection to the database. While an analysis is updated, its previous
+        result continues to be served from the cache. An analysis that fails
+        is logged and does not stop the others.
+
+        Once all analysis are updated, the payloads are rendered again.
+
+        Returns a dictionary `name -> seconds` with the time each analysis
+        took to update, or None for the ones that failed.
+        """
+        names = sorted(self)
+        if workers <= 1:
+            durations = [self._timed_update(name) for name in names]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                durations = list(executor.map(
+                    lambda name: self._timed_update(name, True), names))
+
+        self.render_payloads()
+        return dict(zip(names, durations))
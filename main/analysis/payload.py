@@ -0,0 +1,168 @@
+"""
+JSON payloads of the data endpoints, rendered from results of analysis and
+compressed once, so each request only reads them from the cache.
+"""
+import gzip
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import translation
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# content encodings of a payload, by order of preference.
+ENCODINGS = ('br', 'gzip')
+
+# cache key of the generation of the payloads (see `invalidate_payloads`).
+GENERATION_KEY = 'payloads-generation'
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # a new generation never matches payloads cached before.
+        generation = int(time.time())
+        cache.add(GENERATION_KEY, generation, None)
+        # the cache may not keep it (e.g. a dummy cache or an eviction).
+        generation = cache.get(GENERATION_KEY, generation)
+    return generation
+
+
+def invalidate_payloads():
+    """
+    Starts a new generation of payloads: payloads rendered before (from
+    previous results of analysis) are no longer served.
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, int(time.time()), None)
+
+
+class Payload:
+    """
+    The JSON payload of the data endpoint `name`: the result of
+    `function(*args)` (`function` can be its dotted path), rendered for the
+    active language.
+
+    The rendered payload (the JSON, its compressed versions and its ETag) is
+    cached for `timeout` seconds, or until an analysis is updated (see
+    `invalidate_payloads`); `AnalysisManager.refresh_all` renders it again
+    after updating the analysis.
+    """
+
+    def __init__(self, name, function, *args, timeout=60*60):
+        self.name = name
+        self._function = function
+        self.args = args
+        self.timeout = timeout
+
+    @property
+    def function(self):
+        if isinstance(self._function, str):
+            self._function = import_string(self._function)
+        return self._function
+
+    def _cache_key(self, language, generation):
+        return 'payload-%s-%s-%s' % (self.name, language, generation)
+
+    def render(self, language=None):
+        """
+        Renders the payload in `language` (the active language by default),
+        caches it and returns it as a dictionary with the `etag` and the
+        content of each encoding (`identity`, `gzip` and, if brotli is
+        installed, `br`).
+        """
+        language = language or translation.get_language()
+        # an analysis updated while rendering starts a new generation, so
+        # this payload is not served.
+        generation = _generation()
+        with translation.override(language):
+            data = self.function(*self.args)
+
+        content = json.dumps(data).encode('utf-8')
+        record = {'etag': hashlib.sha1(content).hexdigest(),
+                  'identity': content,
+                  'gzip': gzip.compress(content)}
+        if brotli is not None:
+            record['br'] = brotli.compress(content)
+
+        cache.set(self._cache_key(language, generation), record,
+                  self.timeout)
+        return record
+
+    def get(self):
+        """
+        Returns the rendered payload in the active language.
+        """
+        record = cache.get(self._cache_key(translation.get_language(),
+                                           _generation()))
+        if record is None:
+            record = self.render()
+        return record
+
+
+def _accepted_encodings(request):
+    encodings = set()
+    for value in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        encoding, _, parameters = value.partition(';')
+        parameters = parameters.replace(' ', '')
+        if parameters.startswith('q='):
+            try:
+                if float(parameters[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def _matches(request, etag):
+    """
+    Returns whether the `If-None-Match` of the request matches `etag` (by
+    weak comparison).
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if header is None:
+        return False
+    etags = [x.strip() for x in header.split(',')]
+    return '*' in etags or \
+        etag in [x[2:] if x.startswith('W/') else x for x in etags]
+
+
+def payload_response(request, record):
+    """
+    Returns the response to `request` with a rendered payload (see
+    `Payload.render`), compressed in the best encoding the client accepts,
+    or a 304 if the client already has it.
+    """
+    accepted = _accepted_encodings(request)
+    encoding = next((x for x in ENCODINGS if x in record and x in accepted),
+                    None)
+
+    # each encoding is a different representation, with a different ETag.
+    if encoding is None:
+        etag = '"%s"' % record['etag']
+    else:
+        etag = '"%s-%s"' % (record['etag'], encoding)
+
+    if _matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(record[encoding or 'identity'],
+                                content_type='application/json')
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
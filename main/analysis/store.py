@@ -0,0 +1,43 @@
+import datetime
+import os
+import pickle
+
+from main.tools.files import atomic_write
+
+
+class FileResultStore:
+    """
+    Stores results of analysis in a directory, one pickled file per analysis,
+    so they survive restarts and evictions of the cache.
+
+    Each record is a dictionary with the `result`, the `version` of the
+    analysis that computed it and the time it was computed (`computed_at`).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, '%s.pickle' % name)
+
+    def save(self, name, result, version):
+        os.makedirs(self.directory, exist_ok=True)
+
+        record = {'result': result,
+                  'version': version,
+                  'computed_at': datetime.datetime.now()}
+
+        with atomic_write(self._path(name)) as f:
+            pickle.dump(record, f, pickle.HIGHEST_PROTOCOL)
+
+    def load(self, name):
+        """
+        Returns the record of the analysis `name` or None if it was never
+        stored or cannot be read.
+        """
+        try:
+            with open(self._path(name), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, AttributeError, ImportError,
+                pickle.UnpicklingError):
+            return None
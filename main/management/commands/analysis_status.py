@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from contracts.analysis import analysis_manager as contracts_manager
+from law.analysis import analysis_manager as law_manager
+from deputies.analysis import analysis_manager as deputies_manager
+
+
+MANAGERS = (contracts_manager, law_manager, deputies_manager)
+
+
+class Command(BaseCommand):
+    help = 'Lists when each analysis was last computed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--warm',
+            action='store_true',
+            help='Also load stored results into the cache (e.g. after '
+                 'a deploy), so the first requests do not compute them.')
+
+    def handle(self, **options):
+        for manager in MANAGERS:
+            if options['warm']:
+                manager.warm_cache()
+
+            for name, record in manager.status():
+                if record is None:
+                    self.stdout.write('%s: never computed' % name)
+                    continue
+                outdated = ''
+                if record['version'] != manager[name].version:
+                    outdated = ' (outdated version %d)' % record['version']
+                self.stdout.write('%s: %s%s' % (
+                    name, record['computed_at'].strftime('%Y-%m-%d %H:%M:%S'),
+                    outdated))
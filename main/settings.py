@@ -202,6 +202,12 @@ if not LIVE and hasattr(settings_dev, 'CACHES'):
     CACHES = settings_dev.CACHES
 
 
+############## Analysis ##############
+# directory where results of analysis are stored, e.g.
+# `os.path.join(site_directory, '_analysis')` (None to not store them)
+ANALYSIS_STORE = None
+
+
 ############## Django-SphinxQL specifics ##############
 INDEXES = {
     'path': os.path.join(site_directory, '_index'),
@@ -17,6 +17,8 @@ CACHES = {
 
 LANGUAGE_CODE = 'en'
 
+ANALYSIS_STORE = None
+
 # ignore all logging
 import logging
 logging.disable(logging.CRITICAL)
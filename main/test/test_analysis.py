@@ -0,0 +1,230 @@
+import gzip
+import json
+import shutil
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory, override_settings
+from django.utils import translation
+
+from main.analysis import Analysis, AnalysisManager, Payload, \
+    payload_response
+from main.analysis.store import FileResultStore
+
+
+LOCAL_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+DUMMY_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
+
+class Counter:
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AnalysisTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.function = Counter()
+        self.analysis = Analysis('test', self.function, timeout=60,
+                                 stale_timeout=60)
+
+    def test_fresh(self):
+        self.assertEqual(1, self.analysis.get())
+        self.assertEqual(1, self.analysis.get())
+        self.assertEqual(1, self.function.calls)
+
+    def test_stale_is_recomputed(self):
+        cache.set(self.analysis.name, (0, time.time() - 1), 60)
+
+        self.assertEqual(1, self.analysis.get())
+        self.assertEqual(1, self.function.calls)
+
+    def test_stale_is_served_while_recomputing(self):
+        cache.set(self.analysis.name, (0, time.time() - 1), 60)
+        # someone else is recomputing it
+        self.assertTrue(self.analysis._acquire())
+
+        self.assertEqual(0, self.analysis.get())
+        self.assertEqual(0, self.function.calls)
+
+    def test_miss_waits_for_result(self):
+        self.assertTrue(self.analysis._acquire())
+        self.analysis.lock_timeout = 0
+
+        # the lock was not released in time: the result is computed anyway.
+        self.assertEqual(1, self.analysis.get())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class StoreTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.manager = AnalysisManager(FileResultStore(self.directory))
+        self.function = Counter()
+        self.manager.register(Analysis('test', self.function))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_result_is_stored(self):
+        self.assertEqual([('test', None)], self.manager.status())
+
+        self.manager.get_analysis('test')
+
+        record = self.manager.status()[0][1]
+        self.assertEqual(1, record['result'])
+        self.assertEqual(1, record['version'])
+
+    def test_warm_cache(self):
+        self.manager.get_analysis('test')
+        cache.clear()
+
+        self.assertEqual(['test'], self.manager.warm_cache())
+        self.assertEqual(1, self.manager.get_analysis('test'))
+        self.assertEqual(1, self.function.calls)
+
+    def test_version(self):
+        self.manager.get_analysis('test')
+        cache.clear()
+        self.manager['test'].version = 2
+
+        self.assertEqual([], self.manager.warm_cache())
+        self.assertEqual(2, self.manager.get_analysis('test'))
+
+
+def fail():
+    raise ValueError
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class RefreshTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.manager = AnalysisManager()
+        self.functions = [Counter() for _ in range(3)]
+        for i, function in enumerate(self.functions):
+            self.manager.register(Analysis('test%d' % i, function))
+
+    def _test_refresh(self, workers):
+        durations = self.manager.refresh_all(workers)
+
+        self.assertEqual(['test0', 'test1', 'test2'], sorted(durations))
+        self.assertEqual([1, 1, 1], [f.calls for f in self.functions])
+        self.assertEqual(1, self.manager.get_analysis('test1'))
+
+    def test_refresh(self):
+        self._test_refresh(1)
+
+    def test_refresh_workers(self):
+        self._test_refresh(2)
+
+    def test_failure(self):
+        self.manager.get_analysis('test1')
+        self.manager.register(Analysis('test1', fail))
+
+        for workers in (1, 2):
+            durations = self.manager.refresh_all(workers)
+
+            # the others are updated and the previous result is kept.
+            self.assertIsNone(durations['test1'])
+            self.assertIsNotNone(durations['test2'])
+            self.assertEqual(1, self.manager.get_analysis('test1'))
+        self.assertEqual(2, self.functions[2].calls)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PayloadTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.function = Counter()
+        self.payload = Payload('test', lambda: {'calls': self.function()})
+        self.factory = RequestFactory()
+
+    def test_rendered_once(self):
+        record = self.payload.get()
+        self.assertEqual({'calls': 1}, json.loads(
+            record['identity'].decode('utf-8')))
+        self.assertEqual(record['identity'], gzip.decompress(record['gzip']))
+
+        self.assertEqual(record, self.payload.get())
+        self.assertEqual(1, self.function.calls)
+
+    def test_language(self):
+        with translation.override('en'):
+            self.payload.get()
+        with translation.override('pt'):
+            self.payload.get()
+        self.assertEqual(2, self.function.calls)
+
+    def test_analysis_updated(self):
+        self.payload.get()
+        Analysis('test', lambda: 1).update()
+
+        # the payload may depend on the analysis: it is rendered again
+        self.payload.get()
+        self.assertEqual(2, self.function.calls)
+
+    @override_settings(CACHES=DUMMY_CACHE)
+    def test_dummy_cache(self):
+        # nothing is cached: the payload is rendered on every request
+        self.assertEqual(b'{"calls": 1}', self.payload.get()['identity'])
+        self.assertEqual(b'{"calls": 2}', self.payload.get()['identity'])
+
+    def test_refresh_all(self):
+        manager = AnalysisManager()
+        manager.register_payload(self.payload)
+
+        manager.refresh_all()
+        with translation.override('pt'):
+            self.payload.get()
+        self.assertEqual(2, self.function.calls)
+
+    def test_response(self):
+        record = self.payload.get()
+        etag = '"%s"' % record['etag']
+
+        response = payload_response(self.factory.get('/'), record)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(record['identity'], response.content)
+        self.assertEqual(etag, response['ETag'])
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response = payload_response(self.factory.get(
+            '/', HTTP_IF_NONE_MATCH=etag), record)
+        self.assertEqual(304, response.status_code)
+
+    def test_encoding(self):
+        record = self.payload.get()
+        record.pop('br', None)
+
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        response = payload_response(request, record)
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(record['gzip'], response.content)
+        self.assertEqual('"%s-gzip"' % record['etag'], response['ETag'])
+
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        response = payload_response(request, record)
+        self.assertFalse(response.has_header('Content-Encoding'))
@@ -0,0 +1,22 @@
+from contextlib import contextmanager
+import os
+import tempfile
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    Returns a file, open for writing in binary, that replaces `path` when the
+    ``with`` block exits without errors.
+
+    The content is written to a temporary file in the same directory first,
+    so readers of `path` never see a partially written file.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)